@@ -1,11 +1,116 @@
+from decimal import Decimal
+
 from rest_framework import serializers
-from car_management.models import Car
+from car_management.estimators import MonteCarloEstimator
+from car_management.models import Car, EventType, OdometerReading, Trip
+from car_management.sharding import get_car_shards, get_new_car_shard
 
 class CarSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Car
         fields = [
+            'id',
             'current_gas_level', 
             'gas_capacity'
             ]
 
+    def create(self, validated_data):
+        return Car.objects.db_manager(get_new_car_shard()).create(**validated_data)
+
+
+class RefuelSerializer(serializers.Serializer):
+    amount = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=Decimal(0))
+
+
+class MaintenanceSerializer(serializers.Serializer):
+    event_type = serializers.ChoiceField(choices=EventType.INITIAL_EVENTS)
+
+
+class TripSerializer(serializers.Serializer):
+    distance = serializers.DecimalField(max_digits=9, decimal_places=2, min_value=Decimal(0))
+
+
+class TripProgressSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Trip
+        fields = [
+            'id',
+            'distance',
+            'travelled_distance'
+            ]
+
+
+class OdometerReadingSerializer(serializers.Serializer):
+    car = serializers.IntegerField(min_value=1)
+    km = serializers.DecimalField(
+        max_digits=9,
+        decimal_places=2,
+        min_value=Decimal(0),
+        max_value=Decimal(OdometerReading.MAX_READING_DISTANCE)
+    )
+
+
+class TelemetrySerializer(serializers.Serializer):
+    readings = OdometerReadingSerializer(many=True, allow_empty=False)
+
+    def validate_readings(self, readings):
+        '''
+            Checks every car in the batch exists with a single query per shard, and
+            that no car reports more than MAX_BATCH_DISTANCE in the batch.
+        '''
+
+        car_distances = {}
+        for reading in readings:
+            car_distances[reading['car']] = car_distances.get(reading['car'], 0) + reading['km']
+
+        too_far_car_ids = sorted(
+            car_id for car_id, distance in car_distances.items()
+            if distance > OdometerReading.MAX_BATCH_DISTANCE
+        )
+        if too_far_car_ids:
+            raise serializers.ValidationError(
+                'Readings add up to more than %s km for cars: %s' % (
+                    OdometerReading.MAX_BATCH_DISTANCE,
+                    ', '.join(map(str, too_far_car_ids))
+                )
+            )
+
+        car_ids = set(car_distances)
+        existing_car_ids = set()
+        for shard, shard_car_ids in get_car_shards(car_ids).items():
+            existing_car_ids.update(
+                Car.objects.using(shard).filter(
+                    id__in=shard_car_ids
+                ).values_list('id', flat=True)
+            )
+        missing_car_ids = sorted(car_ids - existing_car_ids)
+
+        if missing_car_ids:
+            raise serializers.ValidationError(
+                'Unknown cars: %s' % ', '.join(map(str, missing_car_ids))
+            )
+
+        return readings
+
+
+class EstimateSerializer(serializers.Serializer):
+    distance = serializers.DecimalField(
+        max_digits=9, decimal_places=2, min_value=Decimal(0),
+        max_value=Decimal(MonteCarloEstimator.MAX_DISTANCE)
+    )
+    scenarios = serializers.IntegerField(min_value=1, max_value=100000, default=10000)
+    seed = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, data):
+        '''
+            The estimate's cost grows with the distance simulated in every scenario.
+        '''
+
+        if data['distance'] * data['scenarios'] > MonteCarloEstimator.MAX_SIMULATED_DISTANCE:
+            raise serializers.ValidationError(
+                'Distance times scenarios must not exceed %s km.' % (
+                    MonteCarloEstimator.MAX_SIMULATED_DISTANCE
+                )
+            )
+
+        return data
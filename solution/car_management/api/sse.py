@@ -0,0 +1,146 @@
+import asyncio
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+
+from car_management.models import Trip
+from car_management.sharding import scatter
+from car_management.streams import trip_events
+
+
+def _get_trip_progress(trip_id):
+    trips = Trip.objects.filter(id=trip_id).values(
+        'distance',
+        'travelled_distance'
+    )
+
+    try:
+        for shard_trips in scatter(trips):
+            progress = shard_trips.first()
+            if progress:
+                return progress
+
+        return None
+    finally:
+        connections.close_all()
+
+
+# NOT THREAD SENSITIVE, SO STREAMS DO NOT QUEUE BEHIND SYNC VIEWS SUCH AS A RUNNING TRIP
+get_trip_progress = sync_to_async(_get_trip_progress, thread_sensitive=False)
+
+
+class TripEventStream:
+    '''
+        ASGI application streaming a trip's progress and maintenance events as
+        Server-Sent Events. Each open stream is a coroutine waiting on its own
+        subscription to the trip's topic, so idle streams cost no threads.
+    '''
+
+    PATH = re.compile(r'^/trips/(?P<trip_id>\d+)/events/$')
+
+    HEARTBEAT_INTERVAL = 15     # SECONDS BETWEEN KEEP-ALIVE COMMENTS
+    IDLE_TIMEOUT = 300          # SECONDS WITHOUT EVENTS BEFORE THE STREAM IS CLOSED
+
+    FINAL_EVENT = 'arrived'
+
+    def matches(self, scope):
+        return scope['type'] == 'http' and bool(self.PATH.match(scope['path']))
+
+    async def __call__(self, scope, receive, send):
+        trip_id = int(self.PATH.match(scope['path']).group('trip_id'))
+
+        # SUBSCRIBING BEFORE READING THE PROGRESS KEEPS MESSAGES PUBLISHED IN BETWEEN
+        with trip_events.subscribe(trip_id) as subscription:
+            progress = await get_trip_progress(trip_id)
+
+            if progress is None:
+                await self.send_not_found(send)
+                return
+
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            await self.send_event(send, 'progress', progress)
+
+            if progress['travelled_distance'] < progress['distance']:
+                await self.stream(subscription, receive, send)
+
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def stream(self, subscription, receive, send):
+        '''
+            Relays published messages until the trip arrives, the client disconnects
+            or the stream stays idle for too long.
+        '''
+
+        loop = asyncio.get_running_loop()
+        idle_since = loop.time()
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+
+        try:
+            while loop.time() - idle_since < self.IDLE_TIMEOUT:
+                next_message = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait(
+                    {next_message, disconnected},
+                    timeout=self.HEARTBEAT_INTERVAL,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if disconnected in done:
+                    next_message.cancel()
+                    return
+
+                if next_message not in done:
+                    next_message.cancel()
+                    await send({
+                        'type': 'http.response.body',
+                        'body': b': keep-alive\n\n',
+                        'more_body': True,
+                    })
+                    continue
+
+                event, data = next_message.result()
+                await self.send_event(send, event, data)
+                idle_since = loop.time()
+
+                if event == self.FINAL_EVENT:
+                    return
+        finally:
+            disconnected.cancel()
+
+    async def wait_for_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    async def send_event(self, send, event, data):
+        body = 'event: %s\ndata: %s\n\n' % (
+            event,
+            json.dumps(data, cls=DjangoJSONEncoder)
+        )
+        await send({
+            'type': 'http.response.body',
+            'body': body.encode(),
+            'more_body': True,
+        })
+
+    async def send_not_found(self, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 404,
+            'headers': [(b'content-type', b'text/plain')],
+        })
+        await send({'type': 'http.response.body', 'body': b'Trip not found'})
+
+
+trip_event_stream = TripEventStream()
@@ -1,6 +1,21 @@
-from rest_framework import viewsets
-from car_management.models import Car
-from car_management.api.serializers import CarSerializer
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, Max, Sum
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from car_management.estimators import MonteCarloEstimator
+from car_management.models import Car, EventType, OdometerReading, Trip, Tyre
+from car_management.routers import get_read_alias
+from car_management.sharding import gather, gather_aggregate
+from car_management.api.serializers import (
+    CarSerializer,
+    EstimateSerializer,
+    MaintenanceSerializer,
+    RefuelSerializer,
+    TelemetrySerializer,
+    TripProgressSerializer,
+    TripSerializer,
+)
 
 
 class GroupViewSet(viewsets.ModelViewSet):
@@ -9,4 +24,169 @@ class GroupViewSet(viewsets.ModelViewSet):
     """
     queryset = Car.objects.all()
     serializer_class = CarSerializer
-    permission_classes = []
\ No newline at end of file
+    permission_classes = []
+
+    def get_queryset(self):
+        '''
+            Looks single cars up on the shard they live on.
+        '''
+
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if lookup is None:
+            return super().get_queryset()
+
+        try:
+            cars = Car.objects.for_car(int(lookup))
+        except ValueError:
+            return Car.objects.using(DEFAULT_DB_ALIAS).none()
+
+        return cars.using(get_read_alias(cars.db))
+
+    def list(self, request):
+        cars = gather(Car.objects.order_by('id'))
+
+        return Response(self.get_serializer(cars, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def fleet(self, request):
+        cars = gather_aggregate(
+            Car.objects.all(),
+            cars=Count('id'),
+            gas_level=Sum('current_gas_level')
+        )
+        tyres = gather_aggregate(
+            Tyre.objects.in_use(),
+            tyres_in_use=Count('id'),
+            max_degradation=Max('degradation')
+        )
+        replaceable_tyres = gather_aggregate(
+            Tyre.objects.replaceable(),
+            replaceable_tyres=Count('id')
+        )
+
+        return Response({**cars, **tyres, **replaceable_tyres})
+
+    @action(detail=True, methods=['post'])
+    def refuel(self, request, pk=None):
+        car = self.get_object()
+        serializer = RefuelSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        if not car.can_be_refueled():
+            return self.refuel_not_needed()
+
+        if car.refuel(serializer.validated_data['amount']) is None:
+            return Response(
+                {'amount': ['Amount exceeds the gas capacity.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(CarSerializer(car).data)
+
+    @action(detail=True, methods=['post'])
+    def maintenance(self, request, pk=None):
+        car = self.get_object()
+        serializer = MaintenanceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        event_type = serializer.validated_data['event_type']
+        if event_type == EventType.REFUEL_ID and not car.can_be_refueled():
+            return self.refuel_not_needed()
+
+        car.maintenance(event_type)
+
+        return Response(CarSerializer(car).data)
+
+    def refuel_not_needed(self):
+        return Response(
+            {'car': ['The car can only be refueled below %s%% of its gas capacity.' % Car.MIN_REFUEL_CAPACITY]},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    @action(detail=True, methods=['post'])
+    def trip(self, request, pk=None):
+        '''
+            Runs a trip and returns it with the car. A car already on the road gets a
+            409 with the running trip, so a retried request does not start a second one.
+        '''
+
+        car = self.get_object()
+        serializer = TripSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        if car.is_missing_tyre():
+            return Response(
+                {'car': ['The car cannot travel without one of its tyres.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        running_trip = Trip.objects.for_car(car.id).filter(Trip.ON_THE_ROAD).first()
+        if running_trip:
+            return Response(
+                {'car': ['The car is already on a trip.'], 'trip': TripProgressSerializer(running_trip).data},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        trip = car.trip_set.create(
+            distance=serializer.validated_data['distance']
+        )
+        trip.start()
+
+        return Response({
+            **TripProgressSerializer(trip).data,
+            'car': CarSerializer(trip.car).data,
+        })
+
+    @action(detail=True, methods=['get'])
+    def trips(self, request, pk=None):
+        '''
+            Lists the car's trips still on the road, read from the primary so they show
+            up as soon as they start. Their ids are what /trips/<id>/events/ streams.
+        '''
+
+        car = self.get_object()
+        trips = Trip.objects.for_car(car.id).filter(Trip.ON_THE_ROAD).order_by('id')
+
+        return Response(TripProgressSerializer(trips, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def estimate(self, request, pk=None):
+        car = self.get_object()
+        serializer = EstimateSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            estimator = MonteCarloEstimator(
+                car,
+                scenarios=serializer.validated_data['scenarios'],
+                seed=serializer.validated_data.get('seed')
+            )
+        except ValueError as error:
+            return Response({'car': [str(error)]}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(estimator.estimate(serializer.validated_data['distance']))
+
+
+class TelemetryViewSet(viewsets.ViewSet):
+    """
+    API endpoint that ingests batches of odometer readings.
+    """
+    permission_classes = []
+
+    def create(self, request):
+        serializer = TelemetrySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        readings = serializer.validated_data['readings']
+        batch, alerts = OdometerReading.ingest(
+            (reading['car'], reading['km']) for reading in readings
+        )
+
+        return Response(
+            {
+                'batch': batch,
+                'readings': len(readings),
+                'alerts': alerts,
+            },
+            status=status.HTTP_201_CREATED
+        )
@@ -0,0 +1,36 @@
+from car_management.models import Car, Tyre
+from car_management.sharding import get_new_car_shard
+
+
+def create_fleet(size, gas_capacity=50, current_gas_level=0, tyre_degradation=0, shard=None):
+    '''
+        Bulk inserts a fleet of cars, each with a full set of tyres in use.
+
+        :param int size: Amount of cars to be created.
+        :param int gas_capacity: Gas capacity in liters for every car.
+        :param float current_gas_level: Liters in gas tank for every car.
+        :param float tyre_degradation: Degradation in % for every tyre.
+        :param str shard: Shard the fleet is created on. Defaults to the least used one.
+    '''
+
+    shard = shard or get_new_car_shard()
+
+    cars = Car.objects.using(shard).bulk_create([
+        Car(
+            gas_capacity=gas_capacity,
+            current_gas_level=current_gas_level
+        )
+        for _ in range(size)
+    ])
+
+    Tyre.objects.using(shard).bulk_create([
+        Tyre(
+            car=car,
+            currently_in_use=True,
+            degradation=tyre_degradation
+        )
+        for car in cars
+        for _ in range(Car.MAX_NUMBER_OF_TYRES)
+    ])
+
+    return cars
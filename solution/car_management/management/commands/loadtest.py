@@ -0,0 +1,288 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test.testcases import QuietWSGIRequestHandler
+
+from car_management.factories import create_fleet
+from car_management.models import EventType
+from car_management.replica import ReplicaRefresher, get_replica_alias, refresh_replica
+from car_management.sharding import get_shards
+
+
+class Command(BaseCommand):
+    help = "Load test the REST API against a scratch database seeded with a fleet of cars"
+
+    # RELATIVE WEIGHT OF EACH ENDPOINT IN THE REQUEST MIX
+    ENDPOINT_WEIGHTS = [
+        ('create_car', 10),
+        ('status', 50),
+        ('refuel', 15),
+        ('maintenance', 15),
+        ('trip', 10),
+    ]
+
+    PERCENTILES = (50, 95, 99)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cars', type=int, default=100, help='Size of the seeded fleet.')
+        parser.add_argument('--clients', type=int, default=50, help='Amount of concurrent clients.')
+        parser.add_argument('--requests', type=int, default=2000, help='Total amount of requests.')
+        parser.add_argument('--trip-distance', type=int, default=100, help='Distance in KM of each trip.')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for the request mix.')
+
+    def handle(self, *args, **options):
+        for option in ('cars', 'clients', 'requests'):
+            if options[option] < 1:
+                raise CommandError('--%s must be a positive number.' % option)
+
+        self.random = random.Random(options['seed'])
+        self.trip_distance = options['trip_distance']
+
+        with self.scratch_database():
+            shards = get_shards()
+            for alias in shards:
+                call_command('migrate', database=alias, verbosity=0, interactive=False)
+            call_command('populate_event_types')
+
+            self.car_ids = []
+            for index, alias in enumerate(shards):
+                fleet_size = len(range(index, options['cars'], len(shards)))
+                self.car_ids += [
+                    car.id for car in create_fleet(
+                        fleet_size,
+                        shard=alias,
+                        gas_capacity=50,
+                        current_gas_level=25
+                    )
+                ]
+            connections.close_all()
+
+            with self.running_server() as port, self.quiet_request_logger(), self.refreshed_replica():
+                started_at = time.perf_counter()
+                results = asyncio.run(
+                    self.run_clients(port, options['clients'], options['requests'])
+                )
+                elapsed = time.perf_counter() - started_at
+
+        self.report(results, elapsed)
+
+    @contextmanager
+    def scratch_database(self):
+        '''
+            Points every car shard and the read replica to temporary SQLite files
+            for the duration of the context.
+        '''
+
+        scratch_dir = tempfile.mkdtemp(prefix='cario_loadtest_')
+        scratch_names = {
+            alias: os.path.join(scratch_dir, 'db.sqlite3.%s' % alias)
+            for alias in get_shards()
+        }
+
+        if get_replica_alias():
+            scratch_names[get_replica_alias()] = os.path.join(scratch_dir, 'db.sqlite3.replica')
+
+        old_names = {}
+        for alias, scratch_name in scratch_names.items():
+            connection = connections[alias]
+            old_names[alias] = connection.settings_dict['NAME']
+
+            connection.close()
+            connection.settings_dict['NAME'] = scratch_name
+            settings.DATABASES[alias]['NAME'] = scratch_name
+
+        try:
+            yield
+        finally:
+            connections.close_all()
+            for alias, old_name in old_names.items():
+                connections[alias].settings_dict['NAME'] = old_name
+                settings.DATABASES[alias]['NAME'] = old_name
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    @contextmanager
+    def refreshed_replica(self):
+        '''
+            Keeps the scratch read replica refreshed while the clients run.
+        '''
+
+        if not get_replica_alias():
+            yield
+            return
+
+        refresh_replica()
+        refresher = ReplicaRefresher(settings.REPLICA_REFRESH_INTERVAL)
+        refresher.start()
+
+        try:
+            yield
+        finally:
+            refresher.stop()
+
+    @contextmanager
+    def quiet_request_logger(self):
+        '''
+            Silences the tracebacks of failed requests, which are counted in the report instead.
+        '''
+
+        logger = logging.getLogger('django.request')
+        old_level = logger.level
+        logger.setLevel(logging.CRITICAL)
+
+        try:
+            yield
+        finally:
+            logger.setLevel(old_level)
+
+    @contextmanager
+    def running_server(self):
+        '''
+            Serves the WSGI application from a background thread on a free port.
+        '''
+
+        server = ThreadedWSGIServer(
+            ('127.0.0.1', 0),
+            QuietWSGIRequestHandler,
+            allow_reuse_address=False
+        )
+        server.set_app(get_wsgi_application())
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+
+        try:
+            yield server.server_address[1]
+        finally:
+            server.shutdown()
+            server.server_close()
+            server_thread.join()
+
+    async def run_clients(self, port, clients, total_requests):
+        '''
+            Runs concurrent clients until the total amount of requests has been sent.
+            Returns the latencies in seconds, the amount of rejected (4xx) and of failed
+            (5xx or connection errors) requests per endpoint.
+        '''
+
+        results = defaultdict(lambda: {'latencies': [], 'rejected': 0, 'errors': 0})
+        pending_requests = iter(range(total_requests))
+        endpoints, weights = zip(*self.ENDPOINT_WEIGHTS)
+
+        async def client():
+            for _ in pending_requests:
+                endpoint = self.random.choices(endpoints, weights)[0]
+                method, path, payload = getattr(self, 'build_%s' % endpoint)()
+
+                started_at = time.perf_counter()
+                try:
+                    status = await self.send_request(port, method, path, payload)
+                except OSError:
+                    status = None
+                results[endpoint]['latencies'].append(time.perf_counter() - started_at)
+
+                if status is None or status >= 500:
+                    results[endpoint]['errors'] += 1
+                elif status >= 400:
+                    results[endpoint]['rejected'] += 1
+
+        await asyncio.gather(*(client() for _ in range(clients)))
+
+        return results
+
+    async def send_request(self, port, method, path, payload=None):
+        '''
+            Sends a single HTTP/1.1 request and returns the response status code.
+        '''
+
+        body = json.dumps(payload).encode() if payload is not None else b''
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+        try:
+            writer.write((
+                '%s %s HTTP/1.1\r\n'
+                'Host: 127.0.0.1\r\n'
+                'Content-Type: application/json\r\n'
+                'Content-Length: %s\r\n'
+                'Connection: close\r\n\r\n' % (method, path, len(body))
+            ).encode() + body)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            await reader.read()
+        finally:
+            writer.close()
+
+        return int(status_line.split()[1])
+
+    def random_car_path(self, action=None):
+        car_id = self.random.choice(self.car_ids)
+        return '/cars/%s/%s' % (car_id, '%s/' % action if action else '')
+
+    def build_create_car(self):
+        return 'POST', '/cars/', {'gas_capacity': 50}
+
+    def build_status(self):
+        return 'GET', self.random_car_path(), None
+
+    def build_refuel(self):
+        return 'POST', self.random_car_path('refuel'), {'amount': 2}
+
+    def build_maintenance(self):
+        event_type_id = self.random.choice([EventType.TYRE_CHANGE_ID, EventType.REFUEL_ID])
+        return 'POST', self.random_car_path('maintenance'), {'event_type': event_type_id}
+
+    def build_trip(self):
+        return 'POST', self.random_car_path('trip'), {'distance': self.trip_distance}
+
+    def get_percentile(self, sorted_values, percentile):
+        '''
+            Returns the nearest-rank percentile of an already sorted list.
+        '''
+
+        rank = max(int(round(percentile / 100 * len(sorted_values))), 1)
+        return sorted_values[rank - 1]
+
+    def report(self, results, elapsed):
+        header = '%-12s %9s %9s %8s %8s %9s' % (
+            'endpoint', 'requests', 'rejected', 'errors', 'error%', 'req/s'
+        )
+        header += ''.join(' %8s' % ('p%s ms' % percentile) for percentile in self.PERCENTILES)
+        self.stdout.write(header)
+
+        endpoints = [endpoint for endpoint, _ in self.ENDPOINT_WEIGHTS if endpoint in results]
+        results['total'] = {
+            key: sum((results[endpoint][key] for endpoint in endpoints), start)
+            for key, start in (('latencies', []), ('rejected', 0), ('errors', 0))
+        }
+
+        for endpoint in endpoints + ['total']:
+            latencies = sorted(results[endpoint]['latencies'])
+            errors = results[endpoint]['errors']
+
+            line = '%-12s %9s %9s %8s %7.1f%% %9.1f' % (
+                endpoint,
+                len(latencies),
+                results[endpoint]['rejected'],
+                errors,
+                100.0 * errors / len(latencies),
+                len(latencies) / elapsed,
+            )
+            line += ''.join(
+                ' %8.1f' % (self.get_percentile(latencies, percentile) * 1000)
+                for percentile in self.PERCENTILES
+            )
+            self.stdout.write(line)
@@ -1,18 +1,31 @@
 from django.core.management.base import BaseCommand
 from car_management.models import EventType
+from car_management.sharding import get_shards
 
 class Command(BaseCommand):
-    help = "Populate database with options provided in EventType.INITIAL_EVENTS"
+    help = "Populate every car shard with options provided in EventType.INITIAL_EVENTS"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            help='Populate a single database alias instead of every car shard.'
+        )
 
     def handle(self, *args, **options):
+        databases = [options['database']] if options['database'] else get_shards()
+
+        for database in databases:
+            self.populate(database)
+
+    def populate(self, database):
         for event_id, event_description in EventType.INITIAL_EVENTS:
-            event_type = EventType.objects.filter(
+            event_type = EventType.objects.using(database).filter(
                 id=event_id
             ).first()
             if event_type:
-                print('An event type already exists with id %s with the description of: "%s". Manual data manipulation may be required required.' % (event_type.id, event_type.description))
+                print('An event type already exists with id %s with the description of: "%s" on %s. Manual data manipulation may be required required.' % (event_type.id, event_type.description, database))
             else:
-                EventType.objects.create(
+                EventType.objects.using(database).create(
                     id=event_id,
                     description=event_description
-                )
\ No newline at end of file
+                )
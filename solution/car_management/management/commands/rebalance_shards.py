@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from car_management.models import Car
+from car_management.sharding import get_shards, move_car
+
+
+class Command(BaseCommand):
+    help = "Move cars between shards, either a single car or until every shard holds about as many cars"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--car', type=int, help='Id of a single car to be moved.')
+        parser.add_argument('--to', help='Database alias of the shard the car is moved to.')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Print the moves without moving any car.'
+        )
+
+    def handle(self, *args, **options):
+        if options['car'] is not None:
+            if options['to'] not in get_shards():
+                raise CommandError('--to must be one of: %s' % ', '.join(get_shards()))
+            moves = [(options['car'], options['to'])]
+        elif options['to']:
+            raise CommandError('--to can only be used together with --car.')
+        else:
+            moves = self.get_balancing_moves()
+
+        for car_id, target in moves:
+            self.stdout.write('Moving car %s to %s' % (car_id, target))
+            if options['dry_run']:
+                continue
+
+            try:
+                move_car(car_id, target)
+            except Car.DoesNotExist as error:
+                raise CommandError(error)
+
+        self.stdout.write('%s car(s) moved.' % (0 if options['dry_run'] else len(moves)))
+
+    def get_balancing_moves(self):
+        '''
+            Returns the moves that leave every shard with at most one car more than any other,
+            moving the newest cars of the fullest shards to the emptiest ones.
+        '''
+
+        car_ids = {
+            alias: list(Car.objects.using(alias).order_by('id').values_list('id', flat=True))
+            for alias in get_shards()
+        }
+        moves = []
+
+        while True:
+            source = max(car_ids, key=lambda alias: len(car_ids[alias]))
+            target = min(car_ids, key=lambda alias: len(car_ids[alias]))
+
+            if len(car_ids[source]) - len(car_ids[target]) <= 1:
+                return moves
+
+            car_id = car_ids[source].pop()
+            car_ids[target].insert(0, car_id)
+            moves.append((car_id, target))
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from car_management.replica import ReplicaRefresher, get_replica_alias, refresh_replica
+
+
+class Command(BaseCommand):
+    help = "Periodically refresh the SQLite read replica from the primary database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.REPLICA_REFRESH_INTERVAL,
+            help='Seconds between refreshes.'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Refresh the replica a single time and exit.'
+        )
+
+    def handle(self, *args, **options):
+        alias = get_replica_alias()
+
+        if alias is None:
+            raise CommandError('No replica is configured in REPLICA_DATABASE.')
+        if connections[alias].vendor != 'sqlite' or connections['default'].vendor != 'sqlite':
+            raise CommandError('Only SQLite replicas can be refreshed with the backup API.')
+
+        refresh_replica()
+
+        if not options['once']:
+            refresher = ReplicaRefresher(options['interval'])
+            refresher.start()
+            try:
+                refresher.join()
+            except KeyboardInterrupt:
+                refresher.stop()
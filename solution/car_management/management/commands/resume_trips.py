@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from car_management.models import Trip, TripClaimed
+from car_management.sharding import get_shards
+
+
+class Command(BaseCommand):
+    help = "Resume the trips left on the road by a crashed or restarted process, on every car shard"
+
+    def handle(self, *args, **options):
+        resumed = skipped = 0
+
+        for alias in get_shards():
+            trips = Trip.objects.using(alias).filter(Trip.get_claimable_filter()).order_by('id')
+
+            for trip in trips:
+                try:
+                    trip.resume()
+                except TripClaimed:
+                    skipped += 1
+                    continue
+
+                resumed += 1
+                self.stdout.write('Resumed trip %s on %s' % (trip.id, alias))
+
+        self.stdout.write('%s trip(s) resumed, %s claimed by another process.' % (resumed, skipped))
@@ -1,8 +1,45 @@
 from django.db import models
 from django.apps import apps
 
+from car_management.sharding import CAR_SCOPED_MODELS, allocate_ids, get_car_shard, get_shards
 
-class TyreManager(models.Manager):
+
+class CarScopedQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        '''
+            Picks the ids of new rows from the shard's sequence before inserting them,
+            which also gives SQLite's bulk inserted rows their primary keys.
+        '''
+
+        objs = list(objs)
+        new_objs = [obj for obj in objs if obj.pk is None]
+
+        ids = allocate_ids(self.model, self.db, len(new_objs)) if new_objs else None
+        for obj, obj_id in zip(new_objs, ids or []):
+            obj.pk = obj_id
+
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class CarScopedManager(models.Manager.from_queryset(CarScopedQuerySet)):
+
+    def for_car(self, car_id):
+        '''
+            Returns the rows of a car, read from and written to the shard the car lives on.
+
+            :param int car_id: Car id.
+        '''
+
+        shard = get_car_shard(car_id)
+        if shard is None:
+            return self.using(get_shards()[0]).none()
+
+        car_lookup = CAR_SCOPED_MODELS[self.model._meta.model_name]
+        return self.using(shard).filter(**{car_lookup: car_id})
+
+
+class TyreManager(CarScopedManager):
     
 
     def get_queryset(self):
@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+from car_management.replica import get_replica_alias, replica_is_available
+from car_management.routers import route_reads_to
+
+
+class ReadReplicaMiddleware:
+    '''
+        Routes the reads of read-only requests to the replica. A client that has just
+        written is pinned to the primary for READ_YOUR_WRITES_SECONDS with a cookie,
+        so it always reads its own writes even before the replica catches up.
+    '''
+
+    COOKIE_NAME = 'primary_until'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        read_only = request.method in SAFE_METHODS
+        use_replica = read_only and not self.is_pinned(request) and replica_is_available()
+
+        with route_reads_to(get_replica_alias() if use_replica else None):
+            response = self.get_response(request)
+
+        if not read_only and response.status_code < 400:
+            pinned_for = settings.READ_YOUR_WRITES_SECONDS
+            response.set_cookie(
+                self.COOKIE_NAME,
+                str(time.time() + pinned_for),
+                max_age=pinned_for,
+                httponly=True,
+                samesite='Lax'
+            )
+
+        return response
+
+    def is_pinned(self, request):
+        '''
+            Returns whether or not the client wrote recently enough to be kept on the primary.
+        '''
+
+        try:
+            pinned_until = float(request.COOKIES.get(self.COOKIE_NAME, 0))
+        except ValueError:
+            return False
+
+        return pinned_until > time.time()
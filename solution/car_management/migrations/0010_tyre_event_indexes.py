@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_management', '0009_auto_20200820_2353'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tyre',
+            index=models.Index(condition=models.Q(currently_in_use=True), fields=['car', 'degradation'], name='tyre_in_use_degradation'),
+        ),
+        migrations.AddIndex(
+            model_name='tyre',
+            index=models.Index(condition=models.Q(currently_in_use=False), fields=['car', 'degradation'], name='tyre_discarded_degradation'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['trip', 'km'], name='event_trip_km'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1 on 2026-10-19 19:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_management', '0010_tyre_event_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='car',
+            name='current_gas_level',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=5, verbose_name='Liters in gas tank'),
+        ),
+        migrations.CreateModel(
+            name='OdometerReading',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.UUIDField(default=uuid.uuid4, verbose_name='Ingestion batch the reading arrived in')),
+                ('km', models.DecimalField(decimal_places=2, max_digits=9, verbose_name='Distance travelled since the last reading in KM')),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='car_management.car')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='odometerreading',
+            index=models.Index(fields=['batch', 'car'], name='odometer_reading_batch_car'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.1 on 2026-10-19 20:08
+
+from django.db import migrations, models
+
+from car_management.sharding import reserve_shard_id_range
+
+
+def reserve_id_range(apps, schema_editor):
+    reserve_shard_id_range(schema_editor.connection, apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_management', '0011_odometerreading'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelocatedCar',
+            fields=[
+                ('car_id', models.IntegerField(primary_key=True, serialize=False, verbose_name='Relocated car id')),
+                ('shard', models.CharField(max_length=100, verbose_name='Database alias of the shard the car lives on')),
+            ],
+        ),
+        migrations.RunPython(reserve_id_range, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1 on 2026-10-19 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_management', '0012_relocatedcar_shard_id_ranges'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last checkpoint of the process running the trip'),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=32, null=True, verbose_name='Token of the process running the trip'),
+        ),
+    ]
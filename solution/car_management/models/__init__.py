@@ -1 +1,3 @@
-from .car_basic import *
\ No newline at end of file
+from .car_basic import *
+from .sharding import *
+from .telemetry import *
@@ -1,11 +1,19 @@
-from django.db import models
+import uuid
+from datetime import timedelta
 
-from car_management.managers import TyreManager
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from car_management.managers import CarScopedManager, TyreManager
+from car_management.streams import trip_events
 from car_management.utils import *
 
 
 class Car (models.Model):
 
+    objects = CarScopedManager()
+
     MIN_REFUEL_CAPACITY = 5
     MAX_NUMBER_OF_TYRES = 4
     KMS_PER_LITER = 8
@@ -13,7 +21,7 @@ class Car (models.Model):
     current_gas_level = models.DecimalField(
         'Liters in gas tank',
         default=0,
-        max_digits=3, 
+        max_digits=5, 
         decimal_places=2
     )
 
@@ -60,7 +68,7 @@ class Car (models.Model):
 
         amount_is_number = is_number(amount)
         if amount_is_number:
-            wont_overflow = amount + self.current_gas_level <= gas_capacity
+            wont_overflow = amount + self.current_gas_level <= self.gas_capacity
 
             if wont_overflow:
                 self.current_gas_level += amount
@@ -69,6 +77,14 @@ class Car (models.Model):
 
         return None
 
+    def can_be_refueled(self):
+        '''
+            Returns whether or not the gas level is below MIN_REFUEL_CAPACITY % of the tank,
+            the only time the car may be refueled.
+        '''
+
+        return self.current_gas_level < self.gas_capacity * self.MIN_REFUEL_CAPACITY / 100
+
     def get_refuel_amount(self):
         '''
             Returns refuel amount in liters so the tank is full.
@@ -88,11 +104,11 @@ class Car (models.Model):
 
         return self.refuel(amount_gas_needed)
 
-    def maintenance(self, event_id):
+    def maintenance(self, event_type_id):
         '''
             Method responsible for calling subroutines for car maintenance.
 
-            :param int event_id: Id of one of the possible events that require some type of maintenance during a trip.
+            :param int event_type_id: Id of one of the possible events that require some type of maintenance during a trip.
         '''
 
         if event_type_id == EventType.TYRE_CHANGE_ID:
@@ -109,9 +125,8 @@ class Car (models.Model):
             Method responsible adding a new tyre to the car.
         '''
 
-        if self.is_missing_tyre:
-            return Tyre.objects.create(
-                car=self,
+        if self.is_missing_tyre():
+            return self.tyre_set.create(
                 currently_in_use=True
             )
         return None
@@ -164,14 +179,13 @@ class Car (models.Model):
         '''
         pass
 
-    @classmethod
-    def is_missing_tyre():
+    def is_missing_tyre(self):
         '''
             Returns whether or not the car is missing at least one tyre.
         '''
 
         amout_tyres_in_use = self.tyre_set.amount_in_use()
-        if amout_tyres_in_use <= self.MAX_NUMBER_OF_TYRES:
+        if amout_tyres_in_use < self.MAX_NUMBER_OF_TYRES:
             return True
 
         return False
@@ -199,6 +213,20 @@ class Tyre (models.Model):
     currently_in_use = models.BooleanField(
         default=False
     )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['car', 'degradation'],
+                name='tyre_in_use_degradation',
+                condition=models.Q(currently_in_use=True),
+            ),
+            models.Index(
+                fields=['car', 'degradation'],
+                name='tyre_discarded_degradation',
+                condition=models.Q(currently_in_use=False),
+            ),
+        ]
     
     def __str__(self):
         if self.car:
@@ -210,7 +238,7 @@ class Tyre (models.Model):
             Method responsible for returning the % left on the tyre's lifespan.
         '''
 
-        percentage_left = Tyre.DEGRADATION_LIMIT - most_used_tyre.degradation
+        percentage_left = Tyre.DEGRADATION_LIMIT - self.degradation
         return percentage_left if percentage_left >= 0 else 0
 
     def replace(self):
@@ -230,12 +258,23 @@ class Tyre (models.Model):
             :param float distance: Distance travelled in KM .
         '''
 
-        self.degradation += distance * Tyre.DEGRADATION_RATE
+        self.degradation += distance / Tyre.DEGRADATION_RATE
         self.save()
 
 
+class TripClaimed(Exception):
+    pass
+
+
 class Trip (models.Model):
 
+    objects = CarScopedManager()
+
+    CHECKPOINT_DISTANCE = 500       # KM TRAVELLED BETWEEN COMMITTED CHECKPOINTS
+    CLAIM_TIMEOUT = 60              # SECONDS WITHOUT A CHECKPOINT BEFORE ANOTHER PROCESS MAY RESUME
+
+    ON_THE_ROAD = Q(travelled_distance__lt=F('distance'))
+
     car = models.ForeignKey(
         'car_management.Car', 
         on_delete=models.CASCADE
@@ -254,9 +293,63 @@ class Trip (models.Model):
         default=0
     )
 
+    claimed_by = models.CharField(
+        'Token of the process running the trip',
+        max_length=32,
+        null=True,
+        blank=True
+    )
+
+    claimed_at = models.DateTimeField(
+        'Last checkpoint of the process running the trip',
+        null=True,
+        blank=True
+    )
+
     def __str__(self):
         return '%s km trip by car %s' % (self.distance, self.car.id)
 
+    @classmethod
+    def get_claimable_filter(cls):
+        '''
+            Returns the filter of trips on the road that no process is running, either
+            never claimed or whose claim went CLAIM_TIMEOUT without a checkpoint.
+        '''
+
+        stale_since = timezone.now() - timedelta(seconds=cls.CLAIM_TIMEOUT)
+
+        return cls.ON_THE_ROAD & (
+            Q(claimed_by__isnull=True) | Q(claimed_at__lt=stale_since)
+        )
+
+    def claim(self):
+        '''
+            Marks the trip as run by this process, unless another process is running it.
+            Claiming is a single conditional update, so only one process wins.
+        '''
+
+        claimed_by = uuid.uuid4().hex
+        claimed = Trip.objects.using(self._state.db).filter(
+            self.get_claimable_filter(),
+            id=self.id
+        ).update(claimed_by=claimed_by, claimed_at=timezone.now())
+
+        if not claimed:
+            raise TripClaimed('Trip %s is being run by another process.' % self.id)
+
+        self.claimed_by = claimed_by
+
+    def release(self):
+        '''
+            Gives up the claim on the trip, so it can be resumed right away.
+        '''
+
+        Trip.objects.using(self._state.db).filter(
+            id=self.id,
+            claimed_by=self.claimed_by
+        ).update(claimed_by=None, claimed_at=None)
+        self.claimed_by = None
+
     def new_event(self, km, event_type_id):
         '''
             Creates new event that happened during the trip.
@@ -268,27 +361,69 @@ class Trip (models.Model):
             event_type = None
 
         if event_type:
-            event = Event.objects.create(
-                trip=self,
+            event = self.event_set.create(
                 event_type=event_type,
                 km=km
             )
+            transaction.on_commit(lambda: trip_events.publish(self.id, 'maintenance', {
+                'km': event.km,
+                'event_type': event_type.id,
+                'description': event_type.description,
+            }), using=self._state.db)
             return event
 
         return None
 
     def start(self):
         '''
-            Routine that simulates what happened during the trip.
+            Routine that simulates what happened during the trip. Every CHECKPOINT_DISTANCE
+            the travelled distance, car, tyres and events are committed together, so a trip
+            interrupted midway can be resumed from its last checkpoint. The trip is claimed
+            first, so two processes never run it at the same time.
         '''
 
-        while not self.has_arrived_at_destination():
-            next_stop_in, tyre_change_in, refuel_in = self.car.get_next_maintenance_stop()
+        if self.has_arrived_at_destination():
+            return
 
-            if self.stop_needed_before_destination(next_stop_in):
-                self.travelled_distance += next_stop_in
+        self.claim()
 
-                self.car.travel(next_stop_in)
+        try:
+            while not self.has_arrived_at_destination():
+                with transaction.atomic(using=self._state.db):
+                    self.travel_to_next_checkpoint()
+
+                self.publish_progress(arrived=self.has_arrived_at_destination())
+        except Exception:
+            self.release()
+            raise
+
+    def resume(self):
+        '''
+            Reloads the trip and its car from the last committed checkpoint and
+            finishes the trip from there.
+        '''
+
+        self.refresh_from_db()
+        self.start()
+
+    def travel_to_next_checkpoint(self):
+        '''
+            Simulates the trip up to the next checkpoint, stopping for maintenance
+            whenever needed, and saves the travelled distance if the trip is still
+            claimed by this process. The claim is renewed, or released on arrival.
+        '''
+
+        checkpoint = min(
+            self.travelled_distance + self.CHECKPOINT_DISTANCE,
+            self.distance
+        )
+
+        while self.travelled_distance < checkpoint:
+            next_stop_in, tyre_change_in, refuel_in = self.car.get_next_maintenance_stop()
+            distance_to_checkpoint = checkpoint - self.travelled_distance
+
+            if self.stop_needed_before_checkpoint(next_stop_in, checkpoint):
+                self.travel(next_stop_in)
 
                 event_type_id = EventType.TYRE_CHANGE_ID if tyre_change_in < refuel_in else EventType.REFUEL_ID
 
@@ -298,7 +433,46 @@ class Trip (models.Model):
                     km=self.travelled_distance,
                     event_type_id=event_type_id
                 )
-    
+            else:
+                self.travel(distance_to_checkpoint)
+
+        arrived = self.has_arrived_at_destination()
+        saved = Trip.objects.using(self._state.db).filter(
+            id=self.id,
+            claimed_by=self.claimed_by
+        ).update(
+            travelled_distance=self.travelled_distance,
+            claimed_by=None if arrived else self.claimed_by,
+            claimed_at=None if arrived else timezone.now()
+        )
+
+        if not saved:
+            raise TripClaimed('Trip %s was claimed by another process.' % self.id)
+        if arrived:
+            self.claimed_by = None
+
+    def travel(self, distance):
+        '''
+            Moves the car forward on the trip.
+
+            :param float distance: Distance travelled in KM .
+        '''
+
+        self.travelled_distance += distance
+        self.car.travel(distance)
+
+    def publish_progress(self, arrived=False):
+        '''
+            Notifies the trip's subscribers of the distance travelled so far.
+
+            :param bool arrived: Whether or not the trip has reached its destination.
+        '''
+
+        trip_events.publish(self.id, 'arrived' if arrived else 'progress', {
+            'distance': self.distance,
+            'travelled_distance': self.travelled_distance,
+        })
+
     def has_arrived_at_destination(self):
         '''
             Returns whether or not the car has reached it's final destination on this Trip.
@@ -306,25 +480,27 @@ class Trip (models.Model):
 
         return True if self.travelled_distance >= self.distance else False
 
-    def stop_needed_before_destination(self, next_stop_distance=None):
+    def stop_needed_before_checkpoint(self, next_stop_distance, checkpoint):
         '''
-            Returns whether or not the car will need maintenance before the end of the Trip. 
-            Calling the method without a distance as an argument will return if the car will
-            need to stop at all until the end of the trip.
+            Returns whether or not the car will need maintenance before reaching a checkpoint.
+            A stop needed exactly at the destination is skipped since the trip ends there.
 
             :param float next_stop_distance: Distance in KM needed for the next maintenance stop.
+            :param float checkpoint: Trip distance in KM of the checkpoint.
         '''
 
-        if not next_stop_distance:
-            next_stop_distance = self.distance
-        
         distance_to_stop = next_stop_distance + self.travelled_distance
 
-        return True if distance_to_stop < self.distance else False
+        if distance_to_stop == self.distance:
+            return False
+
+        return True if distance_to_stop <= checkpoint else False
 
 
 class Event (models.Model):
 
+    objects = CarScopedManager()
+
     trip = models.ForeignKey(
         'car_management.Trip', 
         on_delete=models.CASCADE
@@ -341,6 +517,14 @@ class Event (models.Model):
         decimal_places=2
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['trip', 'km'],
+                name='event_trip_km',
+            ),
+        ]
+
     def __str__(self):
         return '%s on Trip (%s)' % (self.event_type.description, self.trip.id)
 
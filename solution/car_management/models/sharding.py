@@ -0,0 +1,39 @@
+from django.db import models
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from car_management.sharding import allocate_ids, is_car_scoped
+
+
+class RelocatedCar (models.Model):
+    '''
+        Directory of the cars living outside of the shard their id was allocated on,
+        kept on the default database.
+    '''
+
+    car_id = models.IntegerField(
+        'Relocated car id',
+        primary_key=True
+    )
+
+    shard = models.CharField(
+        'Database alias of the shard the car lives on',
+        max_length=100
+    )
+
+    def __str__(self):
+        return 'Car %s on %s' % (self.car_id, self.shard)
+
+
+@receiver(pre_save)
+def allocate_car_scoped_id(sender, instance, raw, using, **kwargs):
+    '''
+        Picks the id of a new car-scoped row from its shard's sequence, see allocate_ids.
+    '''
+
+    if raw or instance.pk is not None or not is_car_scoped(sender):
+        return
+
+    ids = allocate_ids(sender, using, 1)
+    if ids:
+        instance.pk = ids[0]
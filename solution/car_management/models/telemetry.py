@@ -0,0 +1,174 @@
+import uuid
+
+from django.db import models, transaction
+from django.db.models import DecimalField, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Greatest
+
+from car_management.managers import CarScopedManager
+from car_management.models.car_basic import Car, EventType, Tyre
+
+
+class OdometerReading (models.Model):
+
+    objects = CarScopedManager()
+
+    ALERT_EVENT_TYPES = (EventType.REFUEL_ID, EventType.TYRE_CHANGE_ID)
+
+    MAX_READING_DISTANCE = 1000     # KM A SINGLE READING MAY REPORT
+    MAX_BATCH_DISTANCE = 2000       # KM THE READINGS OF A CAR IN ONE BATCH MAY ADD UP TO
+
+    batch = models.UUIDField(
+        'Ingestion batch the reading arrived in',
+        default=uuid.uuid4
+    )
+
+    car = models.ForeignKey(
+        'car_management.Car', 
+        on_delete=models.CASCADE
+        )
+
+    km = models.DecimalField(
+        'Distance travelled since the last reading in KM',
+        max_digits=9, 
+        decimal_places=2
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['batch', 'car'],
+                name='odometer_reading_batch_car',
+            ),
+        ]
+
+    def __str__(self):
+        return '%s km reading for car %s' % (self.km, self.car_id)
+
+    @classmethod
+    def ingest(cls, readings):
+        '''
+            Stores a batch of odometer readings and applies their fuel consumption and tyre
+            degradation to every car in the batch with set-based updates, one transaction per
+            shard. Returns the batch id and the alerts for cars that crossed a maintenance
+            threshold.
+
+            :param list readings: Pairs of (car id, distance travelled in KM).
+        '''
+
+        from car_management.sharding import get_car_shards
+
+        batch = uuid.uuid4()
+        readings = list(readings)
+        car_shards = get_car_shards(car_id for car_id, _ in readings)
+
+        alerts = []
+        for shard, car_ids in car_shards.items():
+            car_ids = set(car_ids)
+            alerts += cls.ingest_on_shard(
+                shard,
+                batch,
+                [(car_id, km) for car_id, km in readings if car_id in car_ids]
+            )
+
+        alerts.sort(key=lambda alert: (
+            cls.ALERT_EVENT_TYPES.index(alert['event_type']),
+            alert['car']
+        ))
+
+        return batch, alerts
+
+    @classmethod
+    def ingest_on_shard(cls, shard, batch, readings):
+        '''
+            Applies the readings of the cars living on a shard and returns their alerts.
+            Gas levels bottom out at an empty tank.
+
+            :param str shard: Database alias of the shard.
+            :param uuid batch: Ingestion batch id.
+            :param list readings: Pairs of (car id, distance travelled in KM).
+        '''
+
+        with transaction.atomic(using=shard):
+            cls.objects.using(shard).bulk_create([
+                cls(batch=batch, car_id=car_id, km=km)
+                for car_id, km in readings
+            ])
+
+            batch_cars = cls.objects.using(shard).filter(batch=batch).values('car')
+            alerts = cls.get_batch_alerts(shard, batch)
+
+            Car.objects.using(shard).filter(id__in=batch_cars).update(
+                current_gas_level=Greatest(
+                    F('current_gas_level') - cls.get_batch_distance(batch) / Car.KMS_PER_LITER,
+                    Value(0),
+                    output_field=DecimalField()
+                )
+            )
+            Tyre.objects.db_manager(shard).in_use().filter(car__in=batch_cars).update(
+                degradation=F('degradation') + cls.get_batch_distance(batch, 'car') / Tyre.DEGRADATION_RATE
+            )
+
+            return alerts
+
+    @classmethod
+    def get_batch_distance(cls, batch, car_field='pk'):
+        '''
+            Returns a subquery with the total distance of a batch for the outer query's car.
+
+            :param uuid batch: Ingestion batch id.
+            :param str car_field: Field of the outer query referencing the car.
+        '''
+
+        total_distance = cls.objects.filter(
+            batch=batch,
+            car=OuterRef(car_field)
+        ).values('car').annotate(
+            total=Cast(Sum('km'), FloatField())
+        ).values('total')
+
+        return Subquery(total_distance, output_field=FloatField())
+
+    @classmethod
+    def get_batch_alerts(cls, shard, batch):
+        '''
+            Returns refuel and tyre change alerts for the cars of a shard whose gas level or
+            tyres cross their maintenance threshold because of the batch. Runs before the
+            batch is applied, since an empty tank no longer tells how much fuel was left.
+
+            :param str shard: Database alias of the shard.
+            :param uuid batch: Ingestion batch id.
+        '''
+
+        batch_cars = cls.objects.using(shard).filter(batch=batch).values('car')
+        event_descriptions = dict(EventType.INITIAL_EVENTS)
+
+        refuel_cars = Car.objects.using(shard).filter(id__in=batch_cars).annotate(
+            batch_fuel=cls.get_batch_distance(batch) / Car.KMS_PER_LITER,
+            refuel_level=F('gas_capacity') * Car.MIN_REFUEL_CAPACITY / 100.0
+        ).filter(
+            current_gas_level__gte=F('refuel_level'),
+            refuel_level__gt=F('current_gas_level') - F('batch_fuel')
+        ).values_list('id', flat=True)
+
+        tyre_change_cars = Tyre.objects.db_manager(shard).in_use().filter(car__in=batch_cars).annotate(
+            batch_degradation=cls.get_batch_distance(batch, 'car') / Tyre.DEGRADATION_RATE
+        ).filter(
+            degradation__lte=Tyre.DEGRADATION_THRESHOLD,
+            degradation__gt=Tyre.DEGRADATION_THRESHOLD - F('batch_degradation')
+        ).values_list('car', flat=True).distinct()
+
+        alerts = []
+        for event_type_id, car_ids in zip(
+            cls.ALERT_EVENT_TYPES,
+            (refuel_cars, tyre_change_cars)
+        ):
+            alerts += [
+                {
+                    'car': car_id,
+                    'event_type': event_type_id,
+                    'description': event_descriptions[event_type_id],
+                }
+                for car_id in sorted(car_ids)
+            ]
+
+        return alerts
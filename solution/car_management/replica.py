@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def get_replica_alias():
+    '''
+        Returns the alias of the read replica, or None if it is not configured.
+    '''
+
+    alias = getattr(settings, 'REPLICA_DATABASE', None)
+    return alias if alias in settings.DATABASES else None
+
+
+def replica_is_available():
+    '''
+        Returns whether or not reads can be sent to the replica. A replica pointing at
+        the primary itself, such as a test mirror, or a SQLite copy that has not been
+        created yet is not available. Neither is a copy that has missed its refreshes:
+        once it is older than twice the refresh interval, reads go to the primary.
+    '''
+
+    alias = get_replica_alias()
+    if alias is None:
+        return False
+
+    replica_settings = connections[alias].settings_dict
+    primary_settings = connections[DEFAULT_DB_ALIAS].settings_dict
+
+    if str(replica_settings['NAME']) == str(primary_settings['NAME']):
+        return False
+
+    if connections[alias].vendor == 'sqlite':
+        try:
+            refreshed_at = os.path.getmtime(replica_settings['NAME'])
+        except OSError:
+            return False
+
+        return time.time() - refreshed_at <= 2 * settings.REPLICA_REFRESH_INTERVAL
+
+    return True
+
+
+def refresh_replica():
+    '''
+        Copies the primary SQLite database over the replica with the backup API.
+        The copy is written next to the replica and moved in place atomically, so
+        readers always open a complete snapshot.
+    '''
+
+    alias = get_replica_alias()
+    primary_path = str(connections[DEFAULT_DB_ALIAS].settings_dict['NAME'])
+    replica_path = str(connections[alias].settings_dict['NAME'])
+    copy_path = '%s.%s.tmp' % (replica_path, os.getpid())
+
+    primary = sqlite3.connect(primary_path)
+    copy = sqlite3.connect(copy_path)
+    try:
+        primary.backup(copy)
+    finally:
+        copy.close()
+        primary.close()
+
+    os.replace(copy_path, replica_path)
+
+
+class ReplicaRefresher(threading.Thread):
+    '''
+        Background thread refreshing the replica every `interval` seconds until stopped.
+    '''
+
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            refresh_replica()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
@@ -0,0 +1,56 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS
+
+_state = threading.local()
+
+
+@contextmanager
+def route_reads_to(alias):
+    '''
+        Sends the reads of the current thread to a database alias for the duration
+        of the context. Passing None keeps reads on the primary.
+
+        :param str alias: Database alias reads are sent to.
+    '''
+
+    previous_alias = getattr(_state, 'read_alias', None)
+    _state.read_alias = alias
+
+    try:
+        yield
+    finally:
+        _state.read_alias = previous_alias
+
+
+def get_read_alias(alias):
+    '''
+        Returns the alias reads meant for a database are sent to. Reads of the
+        primary go to the replica when the current request routes them there.
+
+        :param str alias: Database alias the data lives on.
+    '''
+
+    read_alias = getattr(_state, 'read_alias', None)
+
+    return read_alias if read_alias and alias == DEFAULT_DB_ALIAS else alias
+
+
+class ReadReplicaRouter:
+    '''
+        Sends writes to the primary and reads to the alias chosen for the current
+        request, falling back to the primary.
+    '''
+
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'read_alias', None) or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
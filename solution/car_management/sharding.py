@@ -0,0 +1,497 @@
+import heapq
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, F, Max, Min, Sum
+
+from car_management.routers import get_read_alias
+
+# Every FK chain of these models ends at Car, so a car and all of its rows
+# live together on one shard. Maps each model to the lookup of its car id.
+CAR_SCOPED_MODELS = {
+    'car': 'id',
+    'tyre': 'car',
+    'trip': 'car',
+    'event': 'trip__car',
+    'odometerreading': 'car',
+}
+
+SHARD_VENDORS = ('sqlite', 'postgresql')     # DATABASES WHOSE ID SEQUENCES CAN BE MOVED
+
+SHARD_ID_RANGE = 10 ** 8        # IDS ALLOCATED BY EACH SHARD, STARTING AT INDEX * RANGE. KEEPS
+                                # 21 SHARDS WITHIN 32 BIT AUTO FIELDS
+
+
+@checks.register()
+def check_shards(app_configs, **kwargs):
+    '''
+        Checks every car shard is a configured database that supports shard id ranges,
+        before migrations try to reserve them.
+    '''
+
+    errors = []
+
+    for alias in get_shards():
+        if alias not in settings.DATABASES:
+            errors.append(checks.Error(
+                'CAR_SHARDS lists %r, which is not in DATABASES.' % alias,
+                id='car_management.E001'
+            ))
+        elif connections[alias].vendor not in SHARD_VENDORS:
+            errors.append(checks.Error(
+                'Car shard %r uses %s, which does not support shard id ranges.' % (
+                    alias, connections[alias].vendor
+                ),
+                hint='Use one of: %s.' % ', '.join(SHARD_VENDORS),
+                id='car_management.E002'
+            ))
+
+    return errors
+
+
+def get_shards():
+    return list(getattr(settings, 'CAR_SHARDS', [DEFAULT_DB_ALIAS]))
+
+
+def is_car_scoped(model):
+    return model._meta.app_label == 'car_management' and model._meta.model_name in CAR_SCOPED_MODELS
+
+
+def get_shard_id_start(alias):
+    '''
+        Returns the first id allocated by a shard, so ids never collide across shards.
+
+        :param str alias: Database alias of the shard.
+    '''
+
+    return get_shards().index(alias) * SHARD_ID_RANGE
+
+
+def get_shard_id_range(alias):
+    '''
+        Returns the first id allocated by a shard and the first id past its range.
+
+        :param str alias: Database alias of the shard.
+    '''
+
+    start = get_shard_id_start(alias)
+
+    return start, start + SHARD_ID_RANGE
+
+
+def get_last_car_id(alias):
+    '''
+        Returns the highest car id allocated by a shard, counting its cars that were
+        moved to other shards, or the start of its range if it has allocated none.
+
+        :param str alias: Database alias of the shard.
+    '''
+
+    from car_management.models import Car, RelocatedCar
+
+    start, end = get_shard_id_range(alias)
+    last_ids = [
+        start,
+        Car.objects.using(alias).filter(
+            id__gte=start,
+            id__lt=end
+        ).aggregate(last_id=Max('id'))['last_id'],
+    ]
+
+    if len(get_shards()) > 1:
+        last_ids.append(RelocatedCar.objects.using(DEFAULT_DB_ALIAS).filter(
+            car_id__gte=start,
+            car_id__lt=end
+        ).aggregate(last_id=Max('car_id'))['last_id'])
+
+    return max(last_id for last_id in last_ids if last_id is not None)
+
+
+def get_home_shard(car_id):
+    '''
+        Returns the shard a car id was allocated on, or None for an id outside every shard.
+
+        :param int car_id: Car id.
+    '''
+
+    shards = get_shards()
+    index = car_id // SHARD_ID_RANGE
+
+    return shards[index] if 0 <= index < len(shards) else None
+
+
+def get_car_shards(car_ids):
+    '''
+        Returns a dict of shard alias to the ids of the cars living on it.
+
+        :param iterable car_ids: Car ids.
+    '''
+
+    from car_management.models import RelocatedCar
+
+    car_ids = set(car_ids)
+    relocated = dict(
+        RelocatedCar.objects.using(DEFAULT_DB_ALIAS).filter(
+            car_id__in=car_ids
+        ).values_list('car_id', 'shard')
+    ) if len(get_shards()) > 1 else {}
+
+    car_shards = {}
+    for car_id in sorted(car_ids):
+        shard = relocated.get(car_id) or get_home_shard(car_id)
+        if shard is not None:
+            car_shards.setdefault(shard, []).append(car_id)
+
+    return car_shards
+
+
+def get_car_shard(car_id):
+    '''
+        Returns the shard a car lives on, or None for an id outside every shard.
+
+        :param int car_id: Car id.
+    '''
+
+    for shard in get_car_shards([car_id]):
+        return shard
+
+    return None
+
+
+def get_new_car_shard():
+    '''
+        Returns the shard that has allocated the fewest car ids so far, where new cars go.
+    '''
+
+    shards = get_shards()
+    if len(shards) == 1:
+        return shards[0]
+
+    return min(shards, key=lambda alias: get_last_car_id(alias) - get_shard_id_start(alias))
+
+
+def allocate_ids(model, alias, count):
+    '''
+        Takes `count` ids from the id sequence of a car-scoped table on a SQLite database
+        and returns them, or None where the database picks new ids from the sequence itself.
+        SQLite gives new rows an id past the highest one in the table, which jumps into
+        another shard's range as soon as a moved car brings its rows along.
+
+        :param Model model: Car-scoped model.
+        :param str alias: Database alias the rows are inserted on.
+        :param int count: Amount of ids.
+    '''
+
+    connection = connections[alias]
+    if connection.vendor != 'sqlite':
+        return None
+
+    table = model._meta.db_table
+    start = get_shard_id_start(alias) if alias in get_shards() else 0
+
+    # UPDATING FIRST TAKES THE WRITE LOCK BEFORE THE SEQUENCE IS READ
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        cursor.execute('UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s', [count, table])
+        if not cursor.rowcount:
+            cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start + count])
+
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+        last_id = cursor.fetchone()[0]
+
+    return list(range(last_id - count + 1, last_id + 1))
+
+
+def scatter(queryset):
+    '''
+        Returns the queryset evaluated on every shard, read from the request's read alias.
+
+        :param QuerySet queryset: Car-scoped queryset.
+    '''
+
+    return [queryset.using(get_read_alias(alias)) for alias in get_shards()]
+
+
+def gather(queryset, key=lambda instance: instance.pk):
+    '''
+        Returns the results of a queryset from every shard merged in a single list.
+        The queryset has to be ordered by `key` for the result to be ordered.
+
+        :param QuerySet queryset: Car-scoped queryset.
+        :param callable key: Sort key of the queryset's ordering.
+    '''
+
+    return list(heapq.merge(*scatter(queryset), key=key))
+
+
+def gather_aggregate(queryset, **aggregates):
+    '''
+        Aggregates a queryset on every shard and combines the partial results.
+        Only aggregates that can be combined from partial results are supported.
+
+        :param QuerySet queryset: Car-scoped queryset.
+    '''
+
+    combine = {Count: sum, Sum: sum, Max: max, Min: min}
+    for name, aggregate in aggregates.items():
+        if type(aggregate) not in combine:
+            raise ValueError('%s cannot be combined across shards.' % type(aggregate).__name__)
+
+    partials = [shard_queryset.aggregate(**aggregates) for shard_queryset in scatter(queryset)]
+
+    return {
+        name: combine[type(aggregate)](
+            partial[name] for partial in partials if partial[name] is not None
+        ) if any(partial[name] is not None for partial in partials) else None
+        for name, aggregate in aggregates.items()
+    }
+
+
+def move_car(car_id, target):
+    '''
+        Moves a car, with its tyres, trips, events and readings, to another shard keeping
+        their ids, and records it on the directory. Writes to the car on the source are
+        blocked from before its rows are read until they are deleted, so none made during
+        the move is lost: they wait for the move and then find the car gone. The copy is
+        committed on the target, then the directory is pointed at it and only then the
+        car is deleted from the source, so an interrupted move leaves the car readable on
+        one shard. Running the move again cleans up what an interrupted one left behind.
+
+        :param int car_id: Car id.
+        :param str target: Database alias of the shard the car is moved to.
+    '''
+
+    from car_management.models import Car, Event, OdometerReading, Trip, Tyre
+
+    if target not in get_shards():
+        raise ValueError('%s is not a car shard.' % target)
+
+    source = get_car_shard(car_id)
+    if source is None or not Car.objects.using(source).filter(id=car_id).exists():
+        raise Car.DoesNotExist('Car %s does not exist.' % car_id)
+
+    if source == target:
+        for alias in get_shards():
+            if alias != target:
+                delete_car_rows(car_id, alias)
+        return False
+
+    with transaction.atomic(using=source):
+        if not lock_car(car_id, source):
+            raise Car.DoesNotExist('Car %s does not exist.' % car_id)
+
+        rows = [
+            (Car, Car.objects.using(source).filter(id=car_id)),
+            (Tyre, Tyre.objects.using(source).filter(car_id=car_id)),
+            (Trip, Trip.objects.using(source).filter(car_id=car_id)),
+            (Event, Event.objects.using(source).filter(trip__car_id=car_id)),
+            (OdometerReading, OdometerReading.objects.using(source).filter(car_id=car_id)),
+        ]
+
+        with transaction.atomic(using=target):
+            # LEFTOVERS OF AN INTERRUPTED MOVE
+            Car.objects.using(target).filter(id=car_id).delete()
+
+            for model, queryset in rows:
+                model.objects.using(target).bulk_create(list(queryset))
+
+            reserve_shard_id_range(connections[target])
+
+        record_car_shard(car_id, target)
+        delete_car_rows(car_id, source)
+
+    return True
+
+
+def lock_car(car_id, alias):
+    '''
+        Blocks writes to a car until the current transaction on its shard ends, and
+        returns whether or not the car is there. PostgreSQL locks the car's row, which
+        rows referencing it wait for too. SQLite has no row locks, so the first write of
+        the transaction takes the write lock of the whole database.
+
+        :param int car_id: Car id.
+        :param str alias: Database alias of the shard.
+    '''
+
+    from car_management.models import Car
+
+    cars = Car.objects.using(alias).filter(id=car_id)
+
+    if connections[alias].features.has_select_for_update:
+        return bool(list(cars.select_for_update().values_list('id', flat=True)))
+
+    return bool(cars.update(gas_capacity=F('gas_capacity')))
+
+
+def record_car_shard(car_id, shard):
+    '''
+        Points the directory at the shard a car lives on.
+
+        :param int car_id: Car id.
+        :param str shard: Database alias of the shard.
+    '''
+
+    from car_management.models import RelocatedCar
+
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if shard == get_home_shard(car_id):
+            RelocatedCar.objects.using(DEFAULT_DB_ALIAS).filter(car_id=car_id).delete()
+        else:
+            RelocatedCar.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+                car_id=car_id,
+                defaults={'shard': shard}
+            )
+
+
+def delete_car_rows(car_id, alias):
+    '''
+        Deletes a car and its rows from a shard it does not live on anymore.
+
+        :param int car_id: Car id.
+        :param str alias: Database alias of the shard.
+    '''
+
+    from car_management.models import Car
+
+    with transaction.atomic(using=alias):
+        Car.objects.using(alias).filter(id=car_id).delete()
+
+
+def reserve_shard_id_range(connection, apps=global_apps):
+    '''
+        Points the id sequences of the car-scoped tables of a shard at the highest id it
+        has allocated within its own range, or at the start of the range. Rows copied in
+        from other shards keep ids from those shards' ranges, which must never move the
+        sequence out of its own.
+
+        :param connection: Connection to the shard.
+        :param apps: App registry the car-scoped tables are read from.
+    '''
+
+    if connection.alias not in get_shards():
+        return
+
+    start, end = get_shard_id_range(connection.alias)
+    tables = [
+        model._meta.db_table
+        for model in apps.get_app_config('car_management').get_models()
+        if is_car_scoped(model)
+    ]
+
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute(
+                'SELECT MAX(id) FROM %s WHERE id >= %%s AND id < %%s' % connection.ops.quote_name(table),
+                [start, end]
+            )
+            last_ids = [start, cursor.fetchone()[0] or start]
+
+            sequence_value = get_sequence_value(connection, cursor, table)
+            if sequence_value is not None and start <= sequence_value < end:
+                last_ids.append(sequence_value)
+
+            set_sequence_value(connection, cursor, table, max(last_ids))
+
+
+def get_sequence_value(connection, cursor, table):
+    '''
+        Returns the last id handed out by a table's id sequence, or None if it has none.
+    '''
+
+    if connection.vendor == 'sqlite':
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    if connection.vendor == 'postgresql':
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+        cursor.execute('SELECT last_value, is_called FROM %s' % sequence)
+        last_value, is_called = cursor.fetchone()
+        return last_value if is_called else None
+
+    raise ImproperlyConfigured('Shard id ranges are not supported on %s.' % connection.vendor)
+
+
+def set_sequence_value(connection, cursor, table, value):
+    '''
+        Makes a table's id sequence hand out ids after `value`.
+    '''
+
+    if connection.vendor == 'sqlite':
+        cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [value, table])
+        cursor.execute(
+            'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+            'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+            [table, value, table]
+        )
+    elif connection.vendor == 'postgresql':
+        cursor.execute(
+            "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, %s)",
+            [table, max(value, 1), value >= 1]
+        )
+    else:
+        raise ImproperlyConfigured('Shard id ranges are not supported on %s.' % connection.vendor)
+
+
+class ShardNotSelected(Exception):
+    pass
+
+
+class ShardRouter:
+    '''
+        Sends every query about a car, its tyres, trips, events and readings to the shard
+        the car lives on, and places new cars on the least used shard. Car-scoped queries
+        without an instance to route by raise ShardNotSelected when there is more than
+        one shard, instead of silently reading a single one.
+    '''
+
+    def get_unhinted_shard(self, model):
+        shards = get_shards()
+        if len(shards) == 1:
+            return shards[0]
+
+        raise ShardNotSelected(
+            'Cannot tell which shard to query for %s. Use %s.objects.for_car(car_id), a '
+            'related manager, .using(alias) or scatter().' % (
+                model._meta.label, model.__name__
+            )
+        )
+
+    def get_instance_shard(self, instance):
+        if instance is None or not is_car_scoped(type(instance)):
+            return None
+
+        if instance._state.db:
+            return instance._state.db
+
+        if instance._meta.model_name == 'car':
+            return get_car_shard(instance.pk) if instance.pk else get_new_car_shard()
+
+        if instance._meta.model_name == 'event':
+            trip = instance.trip
+            return trip._state.db or get_car_shard(trip.car_id)
+
+        return get_car_shard(instance.car_id)
+
+    def db_for_read(self, model, **hints):
+        if not is_car_scoped(model):
+            return None
+
+        shard = self.get_instance_shard(hints.get('instance')) or self.get_unhinted_shard(model)
+        return get_read_alias(shard)
+
+    def db_for_write(self, model, **hints):
+        if not is_car_scoped(model):
+            return None
+
+        return self.get_instance_shard(hints.get('instance')) or self.get_unhinted_shard(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True if db in get_shards() else None
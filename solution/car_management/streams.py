@@ -0,0 +1,92 @@
+import asyncio
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Subscription:
+    '''
+        A subscriber's bounded queue of messages published to a topic.
+        When the subscriber falls behind, the oldest pending message is
+        dropped so a slow client never holds back the producer.
+    '''
+
+    MAX_PENDING_MESSAGES = 100
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=self.MAX_PENDING_MESSAGES)
+
+    def put(self, message):
+        '''
+            Queues a message, dropping the oldest one when the queue is full.
+            Must run on the subscription's event loop.
+        '''
+
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    def put_threadsafe(self, message):
+        self.loop.call_soon_threadsafe(self.put, message)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class Broker:
+    '''
+        In-process publish/subscribe of messages grouped by topic. A single
+        producer publishes each message once, from any thread, and every
+        subscriber of the topic receives it on its own event loop.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    @contextmanager
+    def subscribe(self, topic):
+        '''
+            Subscribes to a topic for the duration of the context.
+            Must be called from a running event loop.
+
+            :param topic: Topic to receive messages from.
+        '''
+
+        subscription = Subscription(asyncio.get_running_loop())
+
+        with self.lock:
+            self.subscriptions[topic].add(subscription)
+
+        try:
+            yield subscription
+        finally:
+            with self.lock:
+                self.subscriptions[topic].discard(subscription)
+                if not self.subscriptions[topic]:
+                    del self.subscriptions[topic]
+
+    def has_subscribers(self, topic):
+        return topic in self.subscriptions
+
+    def publish(self, topic, event, data):
+        '''
+            Sends a message to every subscriber of a topic.
+
+            :param topic: Topic to publish the message to.
+            :param str event: Name of the event.
+            :param dict data: Event payload.
+        '''
+
+        if not self.has_subscribers(topic):
+            return
+
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(topic, ()))
+
+        for subscription in subscriptions:
+            subscription.put_threadsafe((event, data))
+
+
+trip_events = Broker()
@@ -0,0 +1,255 @@
+import hashlib
+import os
+import re
+import shutil
+import sys
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.db.migrations.loader import MigrationLoader
+from django.test.runner import DiscoverRunner
+
+from car_management.models import EventType
+from car_management.sharding import get_shards
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def get_migration_hash(shards=None):
+    '''
+        Returns a digest of every migration file, of the seeded data and of the
+        shards, so a snapshot is rebuilt whenever the schema, the initial events
+        or the shards' id ranges change.
+
+        :param list shards: Car shards to hash. Defaults to the configured ones.
+    '''
+
+    digest = hashlib.sha1(django.get_version().encode())
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+
+    for key in sorted(loader.disk_migrations):
+        migration = loader.disk_migrations[key]
+        module = sys.modules[migration.__module__]
+
+        digest.update(('%s.%s' % key).encode())
+        with open(module.__file__, 'rb') as migration_file:
+            digest.update(migration_file.read())
+
+    digest.update(repr(EventType.INITIAL_EVENTS).encode())
+    digest.update(repr(get_shards() if shards is None else shards).encode())
+
+    return digest.hexdigest()[:16]
+
+
+class SnapshotTestRunner(DiscoverRunner):
+    '''
+        Test runner that migrates and seeds a SQLite template once per migration
+        hash and copies it for every test run and parallel worker, instead of
+        running every migration on each run.
+    '''
+
+    def get_snapshot_dir(self):
+        snapshot_dir = getattr(
+            settings,
+            'TEST_SNAPSHOT_DIR',
+            settings.BASE_DIR / '.test_snapshots'
+        )
+        os.makedirs(snapshot_dir, exist_ok=True)
+        return snapshot_dir
+
+    def uses_sqlite_only(self):
+        return all(
+            connections[alias].vendor == 'sqlite'
+            for alias in self.get_databases_aliases()
+        )
+
+    def get_databases_aliases(self):
+        return [alias for alias in connections if alias in settings.DATABASES]
+
+    def get_mirror(self, alias):
+        return connections[alias].settings_dict['TEST'].get('MIRROR')
+
+    def build_template(self, alias, template_path):
+        '''
+            Migrates and seeds a fresh database file and atomically moves it to
+            the template path.
+        '''
+
+        connection = connections[alias]
+        building_path = '%s.%s.tmp' % (template_path, os.getpid())
+
+        if os.path.exists(building_path):
+            os.remove(building_path)
+
+        connection.close()
+        connection.settings_dict['NAME'] = building_path
+
+        call_command(
+            'migrate',
+            database=alias,
+            verbosity=0,
+            interactive=False,
+            run_syncdb=True
+        )
+        if alias in get_shards():
+            call_command('populate_event_types', database=alias)
+
+        connection.close()
+        os.replace(building_path, template_path)
+
+    def get_template(self, alias):
+        '''
+            Returns the path to the alias' template, building it if needed.
+        '''
+
+        snapshot_dir = self.get_snapshot_dir()
+        migration_hash = get_migration_hash()
+        template_path = os.path.join(
+            snapshot_dir,
+            'template_%s_%s.sqlite3' % (alias, migration_hash)
+        )
+
+        if os.path.exists(template_path):
+            return template_path
+
+        with open(os.path.join(snapshot_dir, '.lock'), 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            if not os.path.exists(template_path):
+                if self.verbosity >= 1:
+                    self.log('Building test database snapshot for alias %r...' % alias)
+                self.build_template(alias, template_path)
+                self.prune_templates(alias, migration_hash)
+
+        return template_path
+
+    def prune_templates(self, alias, migration_hash):
+        '''
+            Removes the alias' templates and kept test databases built for other
+            migration hashes.
+        '''
+
+        pattern = re.compile(
+            r'^(template|keepdb)_%s_(?P<hash>[0-9a-f]{16})(_\d+)?\.sqlite3$' % re.escape(alias)
+        )
+
+        for name in os.listdir(self.get_snapshot_dir()):
+            match = pattern.match(name)
+            if match and match.group('hash') != migration_hash:
+                os.remove(os.path.join(self.get_snapshot_dir(), name))
+
+    def get_test_name(self, alias):
+        '''
+            Returns the path of the alias' test database. Kept databases have a
+            stable name so the next --keepdb run reuses them.
+        '''
+
+        if self.keepdb:
+            name = 'keepdb_%s_%s.sqlite3' % (alias, get_migration_hash())
+        else:
+            name = 'test_%s_%s.sqlite3' % (alias, os.getpid())
+
+        return os.path.join(self.get_snapshot_dir(), name)
+
+    def get_setup_aliases(self, aliases=None):
+        '''
+            Returns the aliases the selected tests use, with the aliases they mirror.
+
+            :param set aliases: Aliases Django asks to set up. Defaults to every alias.
+        '''
+
+        aliases = set(self.get_databases_aliases() if aliases is None else aliases)
+        aliases |= {self.get_mirror(alias) for alias in aliases if self.get_mirror(alias)}
+
+        return [alias for alias in self.get_databases_aliases() if alias in aliases]
+
+    def copy_template(self, template_path, test_name):
+        if self.keepdb and os.path.exists(test_name):
+            return
+
+        shutil.copyfile(template_path, test_name)
+
+    def log(self, message):
+        sys.stderr.write(message + '\n')
+
+    def get_worker_names(self, alias):
+        connection = connections[alias]
+
+        return [
+            connection.creation.get_test_db_clone_settings(str(index))['NAME']
+            for index in range(1, self.parallel + 1)
+        ] if self.parallel > 1 else []
+
+    def setup_databases(self, **kwargs):
+        if not self.uses_sqlite_only():
+            return super().setup_databases(**kwargs)
+
+        old_config = []
+        aliases = self.get_setup_aliases(kwargs.get('aliases'))
+
+        for alias in aliases:
+            if self.get_mirror(alias):
+                continue
+
+            connection = connections[alias]
+            old_name = connection.settings_dict['NAME']
+            template_path = self.get_template(alias)
+            test_name = self.get_test_name(alias)
+
+            connection.close()
+            self.copy_template(template_path, test_name)
+            settings.DATABASES[alias]['NAME'] = test_name
+            connection.settings_dict['NAME'] = test_name
+
+            for worker_name in self.get_worker_names(alias):
+                self.copy_template(template_path, worker_name)
+
+            if connection.settings_dict['TEST'].get('SERIALIZE', True):
+                connection._test_serialized_contents = (
+                    connection.creation.serialize_db_to_string()
+                )
+
+            old_config.append((alias, old_name, False))
+
+        for alias in aliases:
+            mirror = self.get_mirror(alias)
+            if not mirror:
+                continue
+
+            connection = connections[alias]
+            old_config.append((alias, connection.settings_dict['NAME'], True))
+
+            connection.close()
+            settings.DATABASES[alias]['NAME'] = connections[mirror].settings_dict['NAME']
+            connection.settings_dict['NAME'] = connections[mirror].settings_dict['NAME']
+
+        return old_config
+
+    def teardown_databases(self, old_config, **kwargs):
+        if not self.uses_sqlite_only():
+            return super().teardown_databases(old_config, **kwargs)
+
+        for alias, old_name, is_mirror in old_config:
+            connection = connections[alias]
+            connection.close()
+
+            if is_mirror:
+                settings.DATABASES[alias]['NAME'] = old_name
+                connection.settings_dict['NAME'] = old_name
+                continue
+
+            test_names = [connection.settings_dict['NAME']]
+            test_names += self.get_worker_names(alias)
+
+            for test_name in test_names:
+                if not self.keepdb and os.path.exists(test_name):
+                    os.remove(test_name)
+
+            settings.DATABASES[alias]['NAME'] = old_name
+            connection.settings_dict['NAME'] = old_name
@@ -1,3 +1,998 @@
-from django.test import TestCase
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from car_management.api.sse import TripEventStream, _get_trip_progress, get_trip_progress, trip_event_stream
+from car_management.estimators import MonteCarloEstimator
+from car_management.factories import create_fleet
+from car_management.models import Car, Event, EventType, OdometerReading, RelocatedCar, Trip, TripClaimed, Tyre
+from car_management.replica import refresh_replica, replica_is_available
+from car_management.routers import ReadReplicaRouter, route_reads_to
+from car_management.sharding import (
+    SHARD_ID_RANGE,
+    ShardNotSelected,
+    check_shards,
+    get_car_shard,
+    get_shards,
+    move_car,
+    record_car_shard,
+)
+from car_management.streams import Broker, Subscription, trip_events
+from car_management.test_runner import SnapshotTestRunner, get_migration_hash
+
+
+class QueryPlanTestCase(TestCase):
+    '''
+        Asserts that the hot car maintenance queries are served by an index.
+    '''
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.car = Car.objects.using('default').create(gas_capacity=50)
+        Tyre.objects.using('default').bulk_create([
+            Tyre(car=cls.car, currently_in_use=True, degradation=degradation)
+            for degradation in (10, 20, 95, 98)
+        ])
+        cls.trip = cls.car.trip_set.create(distance=100)
+        event_type = EventType.objects.get(id=EventType.REFUEL_ID)
+        cls.trip.event_set.create(event_type=event_type, km=10)
+
+    def get_query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN %s' % sql, params)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = self.get_query_plan(queryset)
+
+        self.assertIn(index_name, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotRegex(plan, r'SCAN (TABLE )?car_management_')
+
+    def test_tyres_in_use(self):
+        self.assertUsesIndex(
+            self.car.tyre_set.in_use(),
+            'tyre_in_use_degradation'
+        )
+
+    def test_replaceable_tyres(self):
+        self.assertUsesIndex(
+            self.car.tyre_set.replaceable(),
+            'tyre_in_use_degradation'
+        )
+
+    def test_discarded_tyres(self):
+        self.assertUsesIndex(
+            self.car.tyre_set.discarded(),
+            'tyre_discarded_degradation'
+        )
+
+    def test_most_used_tyre(self):
+        self.assertUsesIndex(
+            self.car.tyre_set.in_use().order_by('-degradation')[:1],
+            'tyre_in_use_degradation'
+        )
+
+    def test_trip_events_by_km(self):
+        self.assertUsesIndex(
+            self.trip.event_set.filter(km__gte=5).order_by('km'),
+            'event_trip_km'
+        )
+
+
+class TestDatabaseSnapshotTestCase(TestCase):
+    '''
+        Checks the snapshot the test database is copied from.
+    '''
+
+    databases = '__all__'
+
+    def test_event_types_are_seeded(self):
+        self.assertEqual(
+            list(EventType.objects.values_list('id', 'description')),
+            EventType.INITIAL_EVENTS
+        )
+
+    def test_kept_databases_have_stable_names(self):
+        self.assertNotEqual(
+            SnapshotTestRunner(keepdb=False).get_test_name('default'),
+            SnapshotTestRunner(keepdb=False).get_test_name('shard_1')
+        )
+        self.assertEqual(
+            os.path.basename(SnapshotTestRunner(keepdb=True).get_test_name('default')),
+            'keepdb_default_%s.sqlite3' % get_migration_hash()
+        )
+
+    def test_only_requested_aliases_are_set_up(self):
+        runner = SnapshotTestRunner()
+
+        self.assertEqual(runner.get_setup_aliases({'default'}), ['default'])
+        self.assertEqual(runner.get_setup_aliases({'replica'}), ['default', 'replica'])
+        self.assertEqual(runner.get_setup_aliases(), runner.get_databases_aliases())
+
+    def test_migration_hash_follows_shards(self):
+        self.assertNotEqual(
+            get_migration_hash(),
+            get_migration_hash(shards=get_shards() + ['shard_2'])
+        )
+
+    def test_migration_hash_follows_migrations(self):
+        migration_hash = get_migration_hash()
+        migration = import_module('car_management.migrations.0012_relocatedcar_shard_id_ranges')
+
+        with tempfile.TemporaryDirectory() as migration_dir:
+            changed_path = os.path.join(migration_dir, 'migration.py')
+            with open(migration.__file__) as original, open(changed_path, 'w') as changed:
+                changed.write(original.read() + '\n# Changed\n')
+
+            with mock.patch.object(migration, '__file__', changed_path):
+                self.assertNotEqual(get_migration_hash(), migration_hash)
+
+        self.assertEqual(get_migration_hash(), migration_hash)
+
+
+class FleetFactoryTestCase(TestCase):
+
+    databases = '__all__'
+
+    def test_create_fleet(self):
+        with self.assertNumQueries(10):
+            cars = create_fleet(50, gas_capacity=40, shard='default')
+
+        self.assertEqual(Car.objects.using('default').filter(gas_capacity=40).count(), 50)
+        self.assertEqual(
+            Tyre.objects.db_manager('default').in_use().filter(car__in=cars).count(),
+            50 * Car.MAX_NUMBER_OF_TYRES
+        )
+
+    def test_create_fleet_after_existing_cars(self):
+        existing_car = Car.objects.using('default').create(gas_capacity=50)
+
+        cars = create_fleet(2, shard=existing_car._state.db)
+
+        self.assertEqual(
+            [car.id for car in cars],
+            [existing_car.id + 1, existing_car.id + 2]
+        )
+
+
+class TelemetryIngestionTestCase(TestCase):
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cars = create_fleet(3, gas_capacity=50, current_gas_level=40, shard='default')
+
+    def post_readings(self, readings):
+        return self.client.post(
+            '/telemetry/',
+            {'readings': [{'car': car.id, 'km': km} for car, km in readings]},
+            format='json'
+        )
+
+    def test_applies_readings_per_car(self):
+        first_car, second_car, third_car = self.cars
+
+        response = self.post_readings([
+            (first_car, 80),
+            (second_car, 16),
+            (first_car, 40),
+        ])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['readings'], 3)
+        self.assertEqual(OdometerReading.objects.using('default').count(), 3)
+
+        gas_levels = dict(Car.objects.using('default').values_list('id', 'current_gas_level'))
+        self.assertEqual(gas_levels[first_car.id], Decimal('25.00'))
+        self.assertEqual(gas_levels[second_car.id], Decimal('38.00'))
+        self.assertEqual(gas_levels[third_car.id], Decimal('40.00'))
+
+        self.assertEqual(
+            set(first_car.tyre_set.in_use().values_list('degradation', flat=True)),
+            {Decimal('40.00')}
+        )
+        self.assertEqual(
+            set(third_car.tyre_set.in_use().values_list('degradation', flat=True)),
+            {Decimal('0.00')}
+        )
+
+    def test_query_count_does_not_grow_with_readings(self):
+        readings = [(car, 1) for car in self.cars] * 100
+
+        with self.assertNumQueries(15):
+            self.post_readings(readings)
+
+    def test_alerts_cars_crossing_thresholds(self):
+        first_car, second_car, third_car = self.cars
+        Car.objects.for_car(first_car.id).update(current_gas_level=Decimal('3'))
+        Tyre.objects.for_car(second_car.id).update(degradation=Decimal('90'))
+        Car.objects.for_car(third_car.id).update(current_gas_level=Decimal('1'))
+
+        response = self.post_readings([
+            (first_car, 8),
+            (second_car, 15),
+            (third_car, 1),
+        ])
+
+        self.assertEqual(response.data['alerts'], [
+            {'car': first_car.id, 'event_type': EventType.REFUEL_ID, 'description': 'Refuel'},
+            {'car': second_car.id, 'event_type': EventType.TYRE_CHANGE_ID, 'description': 'Tyre Change'},
+        ])
+
+    def test_batch_overshooting_the_tank(self):
+        first_car = self.cars[0]
+
+        response = self.post_readings([(first_car, 1000), (first_car, 1000)])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['alerts'], [
+            {'car': first_car.id, 'event_type': EventType.REFUEL_ID, 'description': 'Refuel'},
+            {'car': first_car.id, 'event_type': EventType.TYRE_CHANGE_ID, 'description': 'Tyre Change'},
+        ])
+
+        response = self.client.get('/cars/%s/' % first_car.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['current_gas_level'], '0.00')
+
+    def test_rejects_implausible_distances(self):
+        first_car, second_car, _ = self.cars
+
+        for readings in (
+            [(first_car, OdometerReading.MAX_READING_DISTANCE + 1)],
+            [(second_car, 1000), (first_car, 1000), (second_car, 1000), (second_car, 1)],
+        ):
+            self.assertEqual(self.post_readings(readings).status_code, 400)
+
+        self.assertFalse(OdometerReading.objects.using('default').exists())
+
+    def test_rejects_unknown_cars(self):
+        response = self.client.post(
+            '/telemetry/',
+            {'readings': [{'car': 999, 'km': 10}]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OdometerReading.objects.using('default').exists())
+
+
+class BrokerTestCase(TestCase):
+
+    def test_publish_reaches_every_subscriber(self):
+        broker = Broker()
+
+        async def subscribe_twice():
+            with broker.subscribe('trip') as first, broker.subscribe('trip') as second:
+                publisher = threading.Thread(
+                    target=broker.publish,
+                    args=('trip', 'progress', {'km': 1})
+                )
+                publisher.start()
+                publisher.join()
+
+                return await first.get(), await second.get()
+
+        self.assertEqual(
+            async_to_sync(subscribe_twice)(),
+            (('progress', {'km': 1}), ('progress', {'km': 1}))
+        )
+        self.assertFalse(broker.has_subscribers('trip'))
+
+    def test_slow_subscriber_drops_oldest_messages(self):
+
+        async def overflow():
+            subscription = Subscription(asyncio.get_running_loop())
+            for index in range(Subscription.MAX_PENDING_MESSAGES + 5):
+                subscription.put(index)
+
+            return subscription.queue.qsize(), await subscription.get()
+
+        self.assertEqual(
+            async_to_sync(overflow)(),
+            (Subscription.MAX_PENDING_MESSAGES, 5)
+        )
+
+
+class TripEventStreamTestCase(TransactionTestCase):
+    '''
+        The stream reads trips from a worker thread's connection, so the
+        test data has to be committed.
+    '''
+
+    databases = '__all__'
+    serialized_rollback = True
+
+    def setUp(self):
+        self.car = create_fleet(1)[0]
+        self.trip = self.car.trip_set.create(distance=100)
+
+    def open_stream(self, trip_id, produce=None, stream_application=trip_event_stream):
+        '''
+            Runs the SSE application for a trip while `produce` publishes to it,
+            returning the response status and body.
+        '''
+
+        messages = []
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+
+        async def run():
+            scope = {'type': 'http', 'path': '/trips/%s/events/' % trip_id}
+            stream = asyncio.ensure_future(stream_application(scope, receive, send))
+
+            while produce and not stream.done() and not trip_events.has_subscribers(trip_id):
+                await asyncio.sleep(0.01)
+            if produce:
+                await produce()
+
+            await asyncio.wait_for(stream, timeout=5)
+
+        async_to_sync(run)()
+
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        return messages[0]['status'], body.decode()
+
+    def test_streams_trip_events_until_arrival(self):
+        trip = self.trip
+
+        async def produce():
+            await sync_to_async(trip.new_event, thread_sensitive=True)(
+                km=40,
+                event_type_id=EventType.REFUEL_ID
+            )
+            trip.travelled_distance = trip.distance
+            trip.publish_progress(arrived=True)
+
+        status, body = self.open_stream(trip.id, produce)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body.split('\n\n')[:3], [
+            'event: progress\ndata: {"distance": "100.00", "travelled_distance": "0.00"}',
+            'event: maintenance\ndata: {"km": 40, "event_type": 2, "description": "Refuel"}',
+            'event: arrived\ndata: {"distance": 100, "travelled_distance": 100}',
+        ])
+
+    def test_arrival_while_reading_progress(self):
+        progress = {'distance': Decimal('100.00'), 'travelled_distance': Decimal('0.00')}
+
+        async def arrive_while_reading(trip_id):
+            trip_events.publish(trip_id, 'arrived', {'distance': 100, 'travelled_distance': 100})
+            return progress
+
+        with mock.patch('car_management.api.sse.get_trip_progress', arrive_while_reading):
+            status, body = self.open_stream(self.trip.id)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body.split('\n\n')[1], 'event: arrived\ndata: {"distance": 100, "travelled_distance": 100}')
+
+    def test_stream_does_not_wait_for_sync_views(self):
+        release = threading.Event()
+
+        async def run():
+            running_view = asyncio.ensure_future(
+                sync_to_async(release.wait, thread_sensitive=True)(5)
+            )
+            await asyncio.sleep(0.05)
+            try:
+                return await asyncio.wait_for(get_trip_progress(self.trip.id), timeout=2)
+            finally:
+                release.set()
+                await running_view
+
+        self.assertEqual(async_to_sync(run)()['distance'], Decimal('100.00'))
+
+    def test_lists_trips_in_progress(self):
+        self.car.trip_set.create(distance=50, travelled_distance=50)
+
+        response = APIClient().get('/cars/%s/trips/' % self.car.id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([trip['id'] for trip in response.data], [self.trip.id])
+
+    def test_idle_stream_is_closed(self):
+        stream_application = TripEventStream()
+        stream_application.HEARTBEAT_INTERVAL = 0.01
+        stream_application.IDLE_TIMEOUT = 0.05
+
+        status, body = self.open_stream(
+            self.trip.id,
+            stream_application=stream_application
+        )
+
+        self.assertEqual(status, 200)
+        self.assertIn(': keep-alive', body)
+        self.assertFalse(trip_events.has_subscribers(self.trip.id))
+
+    def test_unknown_trip(self):
+        status, body = self.open_stream(self.trip.id + 1)
+
+        self.assertEqual(status, 404)
+
+
+class TripTestCase(TestCase):
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.car = create_fleet(1, gas_capacity=50, current_gas_level=50)[0]
+
+    def get_events(self, trip):
+        return list(trip.event_set.order_by('km').values_list('km', 'event_type'))
+
+    def test_challenge_trip(self):
+        trip = self.car.trip_set.create(distance=10000)
+
+        trip.start()
+
+        trip.refresh_from_db()
+        self.car.refresh_from_db()
+        self.assertEqual(trip.travelled_distance, Decimal('10000.00'))
+        self.assertGreaterEqual(self.car.current_gas_level, 0)
+        self.assertEqual(self.car.tyre_set.amount_in_use(), Car.MAX_NUMBER_OF_TYRES)
+        self.assertFalse(
+            self.car.tyre_set.in_use().filter(degradation__gt=Tyre.DEGRADATION_LIMIT).exists()
+        )
+        self.assertEqual(
+            trip.event_set.filter(event_type=EventType.REFUEL_ID).count(),
+            len(range(400, 10000, 400))
+        )
+
+    def test_resume_interrupted_trip(self):
+        other_car = create_fleet(1, gas_capacity=50, current_gas_level=50)[0]
+        uninterrupted_trip = other_car.trip_set.create(distance=3000)
+        uninterrupted_trip.start()
+
+        trip = self.car.trip_set.create(distance=3000)
+        maintenance = Car.maintenance
+        calls = []
+
+        def crash_on_fifth_stop(car, event_type_id):
+            calls.append(event_type_id)
+            if len(calls) == 5:
+                raise RuntimeError('Deploy')
+            return maintenance(car, event_type_id)
+
+        with mock.patch.object(Car, 'maintenance', crash_on_fifth_stop):
+            with self.assertRaises(RuntimeError):
+                trip.start()
+
+        checkpoint = Trip.objects.for_car(self.car.id).get(id=trip.id)
+        self.assertEqual(checkpoint.travelled_distance % Trip.CHECKPOINT_DISTANCE, 0)
+        self.assertLess(checkpoint.travelled_distance, trip.distance)
+        self.assertTrue(all(km <= checkpoint.travelled_distance for km, _ in self.get_events(trip)))
+
+        checkpoint.resume()
+
+        self.assertEqual(checkpoint.travelled_distance, Decimal('3000.00'))
+        self.assertEqual(self.get_events(trip), self.get_events(uninterrupted_trip))
+        self.car.refresh_from_db()
+        other_car.refresh_from_db()
+        self.assertEqual(self.car.current_gas_level, other_car.current_gas_level)
+
+    def test_trip_runs_in_a_single_process(self):
+        trip = self.car.trip_set.create(distance=1000)
+        Trip.objects.for_car(self.car.id).update(claimed_by='other', claimed_at=timezone.now())
+
+        with self.assertRaises(TripClaimed):
+            trip.start()
+
+        trip.refresh_from_db()
+        self.assertEqual(trip.travelled_distance, 0)
+        self.assertFalse(trip.event_set.exists())
+
+    def test_trip_stops_when_its_claim_is_taken(self):
+        trip = self.car.trip_set.create(distance=1000)
+        publish_progress = Trip.publish_progress
+
+        def claim_taken_after_first_checkpoint(trip, arrived=False):
+            publish_progress(trip, arrived)
+            Trip.objects.for_car(self.car.id).update(claimed_by='other')
+
+        with mock.patch.object(Trip, 'publish_progress', claim_taken_after_first_checkpoint):
+            with self.assertRaises(TripClaimed):
+                trip.start()
+
+        trip.refresh_from_db()
+        self.assertEqual(trip.travelled_distance, Trip.CHECKPOINT_DISTANCE)
+        self.assertEqual(trip.claimed_by, 'other')
+
+    def test_resume_trips_command(self):
+        interrupted_trip = self.car.trip_set.create(distance=1000, travelled_distance=500)
+        stale_trip = self.car.trip_set.create(
+            distance=1000,
+            claimed_by='crashed',
+            claimed_at=timezone.now() - timedelta(seconds=Trip.CLAIM_TIMEOUT + 1)
+        )
+        running_trip = self.car.trip_set.create(
+            distance=1000,
+            claimed_by='other',
+            claimed_at=timezone.now()
+        )
+        out = StringIO()
+
+        call_command('resume_trips', stdout=out)
+
+        travelled = dict(Trip.objects.for_car(self.car.id).values_list('id', 'travelled_distance'))
+        self.assertEqual(travelled[interrupted_trip.id], Decimal('1000.00'))
+        self.assertEqual(travelled[stale_trip.id], Decimal('1000.00'))
+        self.assertEqual(travelled[running_trip.id], Decimal('0.00'))
+        self.assertIn('2 trip(s) resumed', out.getvalue())
+
+
+class CarActionsTestCase(TestCase):
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.car = create_fleet(1, gas_capacity=50, current_gas_level=2)[0]
+
+    def test_refuel(self):
+        response = self.client.post('/cars/%s/refuel/' % self.car.id, {'amount': 15}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['current_gas_level'], '17.00')
+
+    def test_refuel_over_capacity(self):
+        response = self.client.post('/cars/%s/refuel/' % self.car.id, {'amount': 49}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_refuel_above_minimum_gas_level(self):
+        Car.objects.for_car(self.car.id).update(current_gas_level=Decimal('2.50'))
+
+        for path, data in (
+            ('refuel', {'amount': 1}),
+            ('maintenance', {'event_type': EventType.REFUEL_ID}),
+        ):
+            response = self.client.post('/cars/%s/%s/' % (self.car.id, path), data, format='json')
+            self.assertEqual(response.status_code, 400)
+
+        self.car.refresh_from_db()
+        self.assertEqual(self.car.current_gas_level, Decimal('2.50'))
+
+    def test_maintenance(self):
+        response = self.client.post(
+            '/cars/%s/maintenance/' % self.car.id,
+            {'event_type': EventType.REFUEL_ID},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['current_gas_level'], '50.00')
+
+    def test_trip(self):
+        response = self.client.post('/cars/%s/trip/' % self.car.id, {'distance': 100}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.car.trip_set.get().id)
+        self.assertEqual(response.data['travelled_distance'], '100.00')
+        self.assertEqual(response.data['car']['id'], self.car.id)
+
+    def test_trip_while_on_the_road(self):
+        running_trip = self.car.trip_set.create(distance=1000, travelled_distance=500)
+
+        response = self.client.post('/cars/%s/trip/' % self.car.id, {'distance': 100}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['trip']['id'], running_trip.id)
+        self.assertEqual(self.car.trip_set.count(), 1)
+
+    def test_trip_without_tyres(self):
+        car = Car.objects.using('default').create(gas_capacity=50, current_gas_level=50)
+
+        response = self.client.post('/cars/%s/trip/' % car.id, {'distance': 100}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class LoadTestCommandTestCase(SimpleTestCase):
+
+    databases = '__all__'
+
+    def test_reports_every_endpoint(self):
+        out = StringIO()
+        test_database_name = connection.settings_dict['NAME']
+
+        call_command('loadtest', cars=5, clients=4, requests=60, seed=1, stdout=out)
+
+        report = out.getvalue().splitlines()
+        self.assertEqual(
+            [line.split()[0] for line in report],
+            ['endpoint', 'create_car', 'status', 'refuel', 'maintenance', 'trip', 'total']
+        )
+        self.assertEqual(report[-1].split()[1], '60')
+        self.assertEqual(connection.settings_dict['NAME'], test_database_name)
+
+    def test_rejects_non_positive_sizes(self):
+        for option in ('cars', 'clients', 'requests'):
+            with self.subTest(option=option), self.assertRaisesMessage(CommandError, '--%s' % option):
+                call_command('loadtest', **{option: 0})
+
+
+class ReadReplicaTestCase(TransactionTestCase):
+    '''
+        Points the replica, a mirror of the primary in tests, to a separate
+        SQLite copy. The copy is taken from committed data.
+    '''
+
+    databases = '__all__'
+    serialized_rollback = True
+
+    def setUp(self):
+        self.client = APIClient()
+        self.replica = connections['replica']
+        self.mirror_name = self.replica.settings_dict['NAME']
+        self.replica_dir = tempfile.mkdtemp()
+
+        self.replica.close()
+        self.replica.settings_dict['NAME'] = os.path.join(self.replica_dir, 'db.sqlite3.replica')
+
+    def tearDown(self):
+        self.replica.close()
+        self.replica.settings_dict['NAME'] = self.mirror_name
+        shutil.rmtree(self.replica_dir)
+
+    def get_car_ids(self):
+        return [car['id'] for car in self.client.get('/cars/').data]
+
+    def test_replica_is_unavailable_until_refreshed(self):
+        self.assertFalse(replica_is_available())
+
+        refresh_replica()
+
+        self.assertTrue(replica_is_available())
+
+    def test_router(self):
+        router = ReadReplicaRouter()
+
+        with route_reads_to('replica'):
+            self.assertEqual(router.db_for_read(Car), 'replica')
+            self.assertEqual(router.db_for_write(Car), 'default')
+
+        self.assertEqual(router.db_for_read(Car), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'car_management'))
+
+    def test_reads_go_to_replica(self):
+        replicated_car = Car.objects.using('default').create(gas_capacity=50)
+        refresh_replica()
+        Car.objects.using('default').create(gas_capacity=50)
+
+        self.assertEqual(self.get_car_ids(), [replicated_car.id])
+
+    def test_stale_replica_falls_back_to_primary(self):
+        refresh_replica()
+        Car.objects.using('default').create(gas_capacity=50)
+
+        refreshed_at = time.time() - 2 * settings.REPLICA_REFRESH_INTERVAL - 1
+        os.utime(self.replica.settings_dict['NAME'], (refreshed_at, refreshed_at))
+
+        self.assertFalse(replica_is_available())
+        self.assertEqual(len(self.get_car_ids()), 1)
+
+    def test_client_reads_its_own_writes(self):
+        refresh_replica()
+
+        response = self.client.post('/cars/', {'gas_capacity': 50}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.get_car_ids(), [response.data['id']])
+
+        self.client.cookies.clear()
+        self.assertEqual(self.get_car_ids(), [])
+
+
+class MonteCarloEstimatorTestCase(TestCase):
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.car = create_fleet(1, gas_capacity=50, current_gas_level=30)[0]
+        Tyre.objects.for_car(self.car.id).filter(id=self.car.tyre_set.first().id).update(degradation=50)
+
+    def test_matches_trip_without_variation(self):
+        estimator = MonteCarloEstimator(self.car, scenarios=10)
+        estimator.CONSUMPTION_SPREAD = 0
+        estimator.WEAR_SPREAD = 0
+
+        estimate = estimator.estimate(2500)
+
+        trip = self.car.trip_set.create(distance=2500)
+        trip.start()
+        refuels = trip.event_set.filter(event_type=EventType.REFUEL_ID).count()
+        tyre_changes = trip.event_set.filter(event_type=EventType.TYRE_CHANGE_ID).count()
+
+        self.assertEqual(estimate['refuels'], {'p5': refuels, 'p50': refuels, 'p95': refuels})
+        self.assertEqual(
+            estimate['tyre_changes'],
+            {'p5': tyre_changes, 'p50': tyre_changes, 'p95': tyre_changes}
+        )
+        self.assertEqual(estimate['range']['p50'], 49 * Tyre.DEGRADATION_RATE)
+
+    def test_estimate_endpoint(self):
+        response = self.client.get(
+            '/cars/%s/estimate/' % self.car.id,
+            {'distance': 2500, 'scenarios': 5000, 'seed': 1}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['scenarios'], 5000)
+        for key in ('stops', 'refuels', 'tyre_changes', 'range'):
+            percentiles = response.data[key]
+            self.assertLessEqual(percentiles['p5'], percentiles['p50'])
+            self.assertLessEqual(percentiles['p50'], percentiles['p95'])
+        self.assertLess(response.data['range']['p5'], response.data['range']['p95'])
+
+    def test_bounds_the_simulated_distance(self):
+        for params in (
+            {'distance': MonteCarloEstimator.MAX_DISTANCE + 1, 'scenarios': 1},
+            {'distance': MonteCarloEstimator.MAX_DISTANCE, 'scenarios': 10000},
+        ):
+            response = self.client.get('/cars/%s/estimate/' % self.car.id, params)
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(
+            '/cars/%s/estimate/' % self.car.id,
+            {'distance': MonteCarloEstimator.MAX_DISTANCE, 'scenarios': 5000}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_car_without_tyres(self):
+        car = Car.objects.using('default').create(gas_capacity=50)
+
+        response = self.client.get('/cars/%s/estimate/' % car.id, {'distance': 100})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class ShardingTestCase(TestCase):
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.car = create_fleet(1, gas_capacity=50, current_gas_level=50, shard='default')[0]
+        self.sharded_car = create_fleet(1, gas_capacity=50, current_gas_level=50, shard='shard_1')[0]
+
+    def get_rows(self, car, alias):
+        return (
+            Car.objects.using(alias).filter(id=car.id).count(),
+            Tyre.objects.using(alias).filter(car_id=car.id).count(),
+            Trip.objects.using(alias).filter(car_id=car.id).count(),
+            Event.objects.using(alias).filter(trip__car_id=car.id).count(),
+        )
+
+    def test_shards_allocate_separate_id_ranges(self):
+        self.assertLess(self.car.id, SHARD_ID_RANGE)
+        self.assertGreater(self.sharded_car.id, SHARD_ID_RANGE)
+        self.assertGreater(self.sharded_car.tyre_set.first().id, SHARD_ID_RANGE)
+        self.assertEqual(get_car_shard(self.car.id), 'default')
+        self.assertEqual(get_car_shard(self.sharded_car.id), 'shard_1')
+        self.assertIsNone(get_car_shard(len(get_shards()) * SHARD_ID_RANGE))
+
+    def test_car_scoped_queries_need_a_shard(self):
+        with self.assertRaises(ShardNotSelected):
+            Car.objects.get(id=self.sharded_car.id)
+        with self.assertRaises(ShardNotSelected):
+            Trip.objects.create(car_id=self.sharded_car.id, distance=100)
+
+        self.assertEqual(Car.objects.for_car(self.sharded_car.id).get(), self.sharded_car)
+        self.assertEqual(Tyre.objects.for_car(self.sharded_car.id).count(), Car.MAX_NUMBER_OF_TYRES)
+        self.assertFalse(Car.objects.for_car(len(get_shards()) * SHARD_ID_RANGE).exists())
+
+        with override_settings(CAR_SHARDS=['default']):
+            self.assertEqual(Car.objects.get(), self.car)
+
+    def test_shards_are_checked_at_startup(self):
+        self.assertEqual(check_shards(None), [])
+
+        with override_settings(CAR_SHARDS=['default', 'missing']):
+            self.assertEqual([error.id for error in check_shards(None)], ['car_management.E001'])
+
+        with mock.patch.object(connections['shard_1'], 'vendor', 'oracle'):
+            self.assertEqual([error.id for error in check_shards(None)], ['car_management.E002'])
+
+    def test_new_cars_go_to_least_used_shard(self):
+        create_fleet(2, shard='default')
+
+        response = self.client.post('/cars/', {'gas_capacity': 50}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(get_car_shard(response.data['id']), 'shard_1')
+        self.assertTrue(Car.objects.using('shard_1').filter(id=response.data['id']).exists())
+
+    def test_api_reads_every_shard(self):
+        response = self.client.get('/cars/%s/' % self.sharded_car.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.sharded_car.id)
+
+        response = self.client.get('/cars/')
+        self.assertEqual([car['id'] for car in response.data], [self.car.id, self.sharded_car.id])
+
+        response = self.client.get('/cars/fleet/')
+        self.assertEqual(response.data['cars'], 2)
+        self.assertEqual(response.data['gas_level'], Decimal('100.00'))
+        self.assertEqual(response.data['tyres_in_use'], 2 * Car.MAX_NUMBER_OF_TYRES)
+
+        self.assertEqual(self.client.get('/cars/%s/' % (self.car.id + 1)).status_code, 404)
+        self.assertEqual(self.client.get('/cars/%s/' % (5 * SHARD_ID_RANGE)).status_code, 404)
+
+    def test_trip_stays_on_car_shard(self):
+        response = self.client.post('/cars/%s/trip/' % self.sharded_car.id, {'distance': 1000}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_rows(self.sharded_car, 'shard_1'), (1, 16, 1, 5))
+        self.assertFalse(Trip.objects.using('default').exists())
+        self.assertEqual(
+            _get_trip_progress(self.sharded_car.trip_set.get().id),
+            {'distance': Decimal('1000.00'), 'travelled_distance': Decimal('1000.00')}
+        )
+
+    def test_telemetry_batch_spans_shards(self):
+        response = self.client.post('/telemetry/', {'readings': [
+            {'car': self.car.id, 'km': 80},
+            {'car': self.sharded_car.id, 'km': 160},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(OdometerReading.objects.using('default').get().car_id, self.car.id)
+        self.assertEqual(OdometerReading.objects.using('shard_1').get().car_id, self.sharded_car.id)
+        self.sharded_car.refresh_from_db()
+        self.assertEqual(self.sharded_car.current_gas_level, Decimal('30.00'))
+
+    def test_move_car(self):
+        self.car.trip_set.create(distance=1000).start()
+        rows = self.get_rows(self.car, 'default')
+
+        self.assertTrue(move_car(self.car.id, 'shard_1'))
+
+        self.assertEqual(self.get_rows(self.car, 'shard_1'), rows)
+        self.assertEqual(self.get_rows(self.car, 'default'), (0, 0, 0, 0))
+        self.assertEqual(RelocatedCar.objects.get().shard, 'shard_1')
+        self.assertEqual(get_car_shard(self.car.id), 'shard_1')
+        self.assertEqual(self.client.get('/cars/%s/' % self.car.id).status_code, 200)
+
+        move_car(self.car.id, 'default')
+
+        self.assertEqual(self.get_rows(self.car, 'default'), rows)
+        self.assertFalse(RelocatedCar.objects.exists())
+        self.assertFalse(move_car(self.car.id, 'default'))
+
+    def test_interrupted_move(self):
+        with mock.patch('car_management.sharding.delete_car_rows', side_effect=RuntimeError('Deploy')):
+            for car, target in ((self.car, 'shard_1'), (self.sharded_car, 'default')):
+                with self.assertRaises(RuntimeError):
+                    move_car(car.id, target)
+
+        # THE DIRECTORY LIVES ON DEFAULT, SO IT ROLLS BACK WITH A MOVE OFF DEFAULT
+        self.assertEqual(get_car_shard(self.car.id), 'default')
+        self.assertEqual(get_car_shard(self.sharded_car.id), 'default')
+        for car in (self.car, self.sharded_car):
+            self.assertEqual(self.client.get('/cars/%s/' % car.id).status_code, 200)
+
+        self.assertTrue(move_car(self.car.id, 'shard_1'))
+        self.assertFalse(move_car(self.sharded_car.id, 'default'))
+
+        self.assertEqual(self.get_rows(self.car, 'default'), (0, 0, 0, 0))
+        self.assertEqual(self.get_rows(self.car, 'shard_1'), (1, 4, 0, 0))
+        self.assertEqual(self.get_rows(self.sharded_car, 'shard_1'), (0, 0, 0, 0))
+        self.assertEqual(self.get_rows(self.sharded_car, 'default'), (1, 4, 0, 0))
+
+    def test_ids_stay_within_shard_ranges_after_move(self):
+        move_car(self.sharded_car.id, 'default')
+
+        car = Car.objects.using('default').create(gas_capacity=50)
+        fleet = create_fleet(1, shard='default') + create_fleet(1, shard='shard_1')
+
+        self.assertEqual(get_car_shard(car.id), 'default')
+        self.assertEqual(car.id, self.car.id + 1)
+        self.assertEqual([get_car_shard(car.id) for car in fleet], ['default', 'shard_1'])
+        self.assertEqual(fleet[1].id, self.sharded_car.id + 1)
+        self.assertLess(car.tyre_set.create().id, SHARD_ID_RANGE)
+        self.assertEqual(self.client.get('/cars/%s/' % car.id).status_code, 200)
+        self.assertEqual(self.client.get('/cars/%s/' % self.sharded_car.id).status_code, 200)
+
+        tyre_ids = [
+            set(Tyre.objects.using(alias).values_list('id', flat=True))
+            for alias in get_shards()
+        ]
+        self.assertFalse(set.intersection(*tyre_ids))
+
+        move_car(self.sharded_car.id, 'shard_1')
+        self.assertFalse(RelocatedCar.objects.exists())
+
+    def test_rebalance_command(self):
+        create_fleet(4, shard='default')
+        out = StringIO()
+
+        call_command('rebalance_shards', stdout=out)
+
+        self.assertEqual(Car.objects.using('default').count(), 3)
+        self.assertEqual(Car.objects.using('shard_1').count(), 3)
+        self.assertEqual(RelocatedCar.objects.count(), 2)
+        self.assertIn('2 car(s) moved.', out.getvalue())
+
+
+class MoveCarConcurrencyTestCase(TransactionTestCase):
+    '''
+        Writes to the car come from another thread's connection while it is
+        moved, so the move has to be committed.
+    '''
+
+    databases = '__all__'
+    serialized_rollback = True
+
+    def setUp(self):
+        self.cars = [
+            create_fleet(1, gas_capacity=50, current_gas_level=50, shard=alias)[0]
+            for alias in get_shards()
+        ]
+
+    def write_during_move(self, car, target):
+        '''
+            Moves a car while another thread updates its gas level once the rows
+            have been copied, returning the rows the update reported or its error.
+        '''
+
+        result = []
+
+        def write():
+            try:
+                result.append(Car.objects.for_car(car.id).update(current_gas_level=10))
+            except Exception as error:
+                result.append(error)
+            finally:
+                connections.close_all()
+
+        writer = threading.Thread(target=write)
+
+        def record_car_shard_while_writing(*args):
+            writer.start()
+            writer.join(0.5)
+            self.assertTrue(writer.is_alive())
+            record_car_shard(*args)
+
+        with mock.patch('car_management.sharding.record_car_shard', record_car_shard_while_writing):
+            move_car(car.id, target)
+
+        writer.join()
+        return result[0]
+
+    def test_writes_wait_for_the_move(self):
+        for car, target in zip(self.cars, reversed(get_shards())):
+            result = self.write_during_move(car, target)
+
+            # THE WRITE EITHER FINDS THE CAR GONE OR FAILS, BUT IS NEVER SILENTLY LOST
+            self.assertNotEqual(result, 1)
+            self.assertEqual(get_car_shard(car.id), target)
+            self.assertEqual(
+                Car.objects.for_car(car.id).get().current_gas_level,
+                Decimal('50.00')
+            )
@@ -13,4 +13,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cario.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from car_management.api.sse import trip_event_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if trip_event_stream.matches(scope):
+        return await trip_event_stream(scope, receive, send)
+
+    return await django_application(scope, receive, send)
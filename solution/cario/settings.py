@@ -49,6 +49,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'car_management.middleware.ReadReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'cario.urls'
@@ -79,9 +80,44 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    'shard_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3.shard_1',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3.replica',
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+DATABASE_ROUTERS = [
+    'car_management.sharding.ShardRouter',
+    'car_management.routers.ReadReplicaRouter',
+]
+
+# Databases cars, with their tyres, trips and events, are spread across.
+# Each shard allocates ids from a range given by its position in the list,
+# so shards must only ever be appended. Migrate every shard with
+# `manage.py migrate --database <alias>`.
+CAR_SHARDS = ['default', 'shard_1']
+
+# Read-only requests are served from this alias, refreshed with
+# `manage.py refresh_replica --interval`. Clients are kept on the primary
+# after their own writes for longer than the refresh interval.
+REPLICA_DATABASE = 'replica'
+
+REPLICA_REFRESH_INTERVAL = 5
+
+READ_YOUR_WRITES_SECONDS = 10
+
+TEST_RUNNER = 'car_management.test_runner.SnapshotTestRunner'
+
+TEST_SNAPSHOT_DIR = BASE_DIR / '.test_snapshots'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -20,6 +20,7 @@ from car_management.api import views as api_views
 
 router = routers.DefaultRouter()
 router.register(r'cars', api_views.GroupViewSet)
+router.register(r'telemetry', api_views.TelemetryViewSet, basename='telemetry')
 
 urlpatterns = [
     path('', include(router.urls)),